@@ -0,0 +1,283 @@
+"""
+Benchmarks the solvers across grid sizes.
+Run from the repository root:
+  python -m benchmarks.run_benchmarks --sizes 3x4,20x20,200x200 --output results.json
+Every record holds wall time, the work done (sweeps, backups or episodes),
+transitions per second (Bellman backup entries, or environment steps counted
+through GridWorld.monitor), the policy's regret against the value-iteration optimum
+and, with --memory, peak traced memory (from a second, traced run). The run fails
+(exit code 1) if a solver got slower or worse than in the baseline results,
+benchmarks/baseline.json unless --baseline names another file ("" to skip).
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from grid_world.environment import GridWorld
+from solvers.instrumentation import Monitor
+from solvers.utils import bellman_q
+from solvers.value_iteration import value_iteration, value_iteration_deterministic
+from solvers.tiled_value_iteration import tiled_value_iteration
+from solvers.policy_iteration import policy_iteration
+from solvers.mc.naive_mc import MC_naive_PolicyIteration
+from solvers.mc.first_visit_mc import FirstVisit_PolicyImprovement
+from solvers.td.q_learning import q_learning, q_learning_batched
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def make_grid_world(height: int,
+                    width: int,
+                    wall_density: float=0.1,
+                    slip_prob: float=0.05,
+                    step_cost: float=-0.02,
+                    seed: int=0) -> GridWorld:
+  """
+  Builds a random GridWorld with a +1 goal and a -1 pit on free cells.
+  """
+  rng = np.random.default_rng(seed)
+  cells = rng.permutation(height * width)
+  num_walls = min(int(wall_density * height * width), height * width - 3)
+  walls = [divmod(int(c), width) for c in cells[:num_walls]]
+  goal, pit = divmod(int(cells[num_walls]), width), divmod(int(cells[num_walls + 1]), width)
+  rewards = np.zeros((height, width))
+  rewards[goal], rewards[pit] = 1.0, -1.0
+  return GridWorld((height, width), [goal, pit], rewards, walls, step_cost, slip_prob)
+
+
+def _start_and_target(grid_world):
+  free = np.flatnonzero(grid_world.model.active_mask)
+  goal = grid_world.terminal[0]
+  return grid_world.index_to_state(free[0]), goal
+
+
+def _vi(grid_world, gamma, **kwargs):
+  V, P, stats = value_iteration(grid_world, gamma, return_stats=True, **kwargs)
+  return V, P, {"sweeps": stats.get("equivalent_sweeps", stats["iterations"]), "backups": stats["backups"]}
+
+
+def _tiled_vi(grid_world, gamma):
+  V, P, stats = tiled_value_iteration(grid_world, gamma, return_stats=True)
+  return V, P, {"sweeps": stats["iterations"], "backups": stats["backups"]}
+
+
+def _vi_deterministic(grid_world, gamma):
+  V, P = value_iteration_deterministic(grid_world, gamma, backend="numpy")
+  return V, P.astype(int), {}
+
+
+def _pi(grid_world, gamma, **kwargs):
+  V, P, stats = policy_iteration(grid_world, gamma, return_stats=True, **kwargs)
+  return V, P, {"iterations": stats["iterations"]}
+
+
+def _mc_naive(grid_world, gamma):
+  policy, _ = MC_naive_PolicyIteration(grid_world, gamma, length=25, samples=20, max_iter=20)
+  return None, policy, {}
+
+
+def _first_visit(grid_world, gamma):
+  policy = FirstVisit_PolicyImprovement(grid_world, gamma, length=100, max_iter=200, seed=0)
+  return None, policy, {}
+
+
+def _q_learning(grid_world, gamma):
+  start, target = _start_and_target(grid_world)
+  return None, q_learning(grid_world, start, target, gamma, num_episodes=100), {"episodes": 100}
+
+
+def _q_learning_batched(grid_world, gamma):
+  start, target = _start_and_target(grid_world)
+  policy = q_learning_batched(grid_world, start, target, gamma, num_batches=100, num_envs=64, seed=0)
+  return None, policy, {"batches": 100}
+
+
+def _dqn(grid_world, gamma):
+  from solvers.dqn.dqn import dqn #Needs torch, so only imported when asked for.
+  V, policy = dqn(grid_world, gamma, seed=0)
+  return V, policy, {}
+
+
+# name -> (runner, largest number of cells it is run on by default)
+SOLVERS = {"value_iteration": (_vi, 400),
+           "value_iteration_numpy": (lambda g, gamma: _vi(g, gamma, backend="numpy"), 10**6),
+           "value_iteration_gauss_seidel": (lambda g, gamma: _vi(g, gamma, backend="numpy", mode="gauss_seidel"), 10**6),
+           "value_iteration_prioritized": (lambda g, gamma: _vi(g, gamma, mode="prioritized"), 10**4),
+           "value_iteration_tiled": (_tiled_vi, 10**6),
+           "value_iteration_deterministic": (_vi_deterministic, 10**6),
+           "policy_iteration": (_pi, 400),
+           "policy_iteration_direct": (lambda g, gamma: _pi(g, gamma, method="direct"), 250000),
+           "policy_iteration_modified": (lambda g, gamma: _pi(g, gamma, k=10), 10**6),
+           "mc_naive": (_mc_naive, 400),
+           "first_visit_mc": (_first_visit, 2500),
+           "q_learning": (_q_learning, 2500),
+           "q_learning_batched": (_q_learning_batched, 40000),
+           "dqn": (_dqn, 400),
+           }
+# dqn takes minutes and needs torch, so it only runs when named in --solvers.
+DEFAULT_SOLVERS = [name for name in SOLVERS if name != "dqn"]
+
+
+def _transitions(grid_world, work: dict, env_steps: int):
+  if work.get("backups") is not None: #Each backup reads every (action, outcome) entry.
+    model = grid_world.model
+    return work["backups"] * model.num_actions * model.num_outcomes
+  return env_steps or None
+
+
+def _regret(grid_world, policy, Q_opt):
+  model = grid_world.model
+  states = np.flatnonzero(model.active_mask)
+  actions = np.asarray(policy).ravel()[states].astype(int)
+  valid = actions >= 0
+  chosen = np.full(states.size, -np.inf)
+  chosen[valid] = Q_opt[states[valid], actions[valid]]
+  best = Q_opt[states].max(axis=1)
+  return float(np.max(best - chosen, initial=0.0)), float(np.mean(np.isclose(best, chosen)))
+
+
+def run_one(name: str,
+            grid_world: GridWorld,
+            gamma: float,
+            Q_opt: np.array,
+            V_opt: np.array,
+            measure_memory: bool=False) -> dict:
+  runner, _ = SOLVERS[name]
+  np.random.seed(0)
+  grid_world.monitor = Monitor() #Counts the environment steps of sample-based solvers.
+  try:
+    start = time.perf_counter()
+    V, policy, work = runner(grid_world, gamma)
+    wall_time = time.perf_counter() - start
+  finally:
+    env_steps, grid_world.monitor = grid_world.monitor.counters["env_steps"], None
+  peak = None
+  if measure_memory:
+    np.random.seed(0)
+    tracemalloc.start()
+    runner(grid_world, gamma)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+  regret, agreement = _regret(grid_world, policy, Q_opt)
+  active = grid_world.model.active_mask.reshape(V_opt.shape)
+  transitions = _transitions(grid_world, work, env_steps)
+  return {"solver": name,
+          "size": f"{grid_world.height}x{grid_world.width}",
+          "cells": grid_world.height * grid_world.width,
+          "wall_time": wall_time,
+          **work,
+          "transitions": transitions,
+          "transitions_per_sec": None if transitions is None else transitions / max(wall_time, 1e-12),
+          "peak_memory_bytes": peak,
+          "policy_regret": regret,
+          "policy_agreement": agreement,
+          "value_error": None if V is None else float(np.max(np.abs(V - V_opt)[active], initial=0.0)),
+          }
+
+
+def run_benchmarks(sizes: list,
+                   solvers: list,
+                   wall_density: float=0.1,
+                   slip_prob: float=0.05,
+                   gamma: float=0.9,
+                   max_cells: int=None,
+                   measure_memory: bool=False,
+                   seed: int=0) -> list:
+  results = []
+  for height, width in sizes:
+    grid_world = make_grid_world(height, width, wall_density, slip_prob, seed=seed)
+    V_opt, _ = value_iteration(grid_world, gamma, backend="numpy")
+    Q_opt = bellman_q(grid_world.model, V_opt.ravel(), gamma)
+    for name in solvers:
+      limit = SOLVERS[name][1] if max_cells is None else max_cells
+      if height * width > limit:
+        continue
+      record = run_one(name, grid_world, gamma, Q_opt, V_opt, measure_memory)
+      record.update(wall_density=wall_density, slip_prob=slip_prob, gamma=gamma)
+      print(f"{record['solver']:>32} {record['size']:>11} {record['wall_time']:10.4f}s "
+            f"regret={record['policy_regret']:.2e}", file=sys.stderr)
+      results.append(record)
+  return results
+
+
+def compare_to_baseline(results: list,
+                        baseline: list,
+                        time_tolerance: float=0.25,
+                        regret_tolerance: float=1e-3,
+                        min_time: float=0.01) -> list:
+  """
+  Returns a list of regression messages (empty if none) for records present in both runs.
+  A slowdown counts only if it exceeds both time_tolerance (relative) and min_time
+  seconds, so timer noise on tiny grids does not fail the run.
+  """
+  reference = {(r["solver"], r["size"]): r for r in baseline}
+  failures = []
+  for record in results:
+    old = reference.get((record["solver"], record["size"]))
+    if old is None:
+      continue
+    slowdown = record["wall_time"] - old["wall_time"]
+    if slowdown > time_tolerance * old["wall_time"] and slowdown > min_time:
+      failures.append(f"{record['solver']} {record['size']}: wall time {record['wall_time']:.4f}s "
+                      f"vs baseline {old['wall_time']:.4f}s")
+    if record["policy_regret"] > old["policy_regret"] + regret_tolerance:
+      failures.append(f"{record['solver']} {record['size']}: policy regret {record['policy_regret']:.3e} "
+                      f"vs baseline {old['policy_regret']:.3e}")
+  return failures
+
+
+def _write_csv(path: str, results: list):
+  fields = sorted({key for record in results for key in record})
+  with open(path, "w", newline="") as f:
+    writer = csv.DictWriter(f, fieldnames=fields)
+    writer.writeheader()
+    writer.writerows(results)
+
+
+def _parse_sizes(text: str) -> list:
+  return [tuple(int(n) for n in size.split("x")) for size in text.split(",")]
+
+
+def main(argv=None) -> int:
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--sizes", default="3x4,10x10,50x50,200x200,1000x1000")
+  parser.add_argument("--solvers", default=",".join(DEFAULT_SOLVERS), help=f"any of {','.join(SOLVERS)}")
+  parser.add_argument("--wall-density", type=float, default=0.1)
+  parser.add_argument("--slip-prob", type=float, default=0.05)
+  parser.add_argument("--gamma", type=float, default=0.9)
+  parser.add_argument("--max-cells", type=int, default=None, help="override the per-solver size limits")
+  parser.add_argument("--memory", action="store_true", help="rerun every solver traced to record peak memory")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--output", default="benchmark_results.json")
+  parser.add_argument("--csv", default=None)
+  parser.add_argument("--baseline", default=BASELINE, help="JSON results to check for regressions (\"\" to skip)")
+  parser.add_argument("--time-tolerance", type=float, default=0.25)
+  parser.add_argument("--regret-tolerance", type=float, default=1e-3)
+  parser.add_argument("--min-time", type=float, default=0.01, help="ignore slowdowns below this many seconds")
+  args = parser.parse_args(argv)
+
+  results = run_benchmarks(_parse_sizes(args.sizes), args.solvers.split(","), args.wall_density,
+                           args.slip_prob, args.gamma, args.max_cells, args.memory, args.seed)
+  meta = {"python": sys.version.split()[0], "numpy": np.__version__, "machine": platform.machine()}
+  with open(args.output, "w") as f:
+    json.dump({"meta": meta, "results": results}, f, indent=2)
+  if args.csv:
+    _write_csv(args.csv, results)
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)["results"]
+    failures = compare_to_baseline(results, baseline, args.time_tolerance, args.regret_tolerance,
+                                   args.min_time)
+    for failure in failures:
+      print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
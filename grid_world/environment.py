@@ -1,4 +1,20 @@
 import numpy as np
+from .model import MOVES, TransitionModel, cells_to_mask, compile_model
+from .planning import Planner
+
+
+def _cells(cells) -> tuple:
+  """Immutable copy of a list of (row, col) cells."""
+  return tuple((int(cell[0]), int(cell[1])) for cell in cells)
+
+
+def _read_only(array) -> np.array:
+  """Read-only copy of array; arrays that are read-only already (e.g. memmaps opened with mode "r") are kept."""
+  if isinstance(array, np.ndarray) and not array.flags.writeable:
+    return array
+  array = np.array(array)
+  array.flags.writeable = False
+  return array
 
 
 class GridWorld:
@@ -9,19 +25,26 @@ class GridWorld:
     width: Number of columns in the grid.
     grid: Numpy array representing the grid.
     actions: List of strings representing moves.
-    rewards: Array defining the reward at each state.
-    terminal: List of tuples defining terminal states on the grid.
-    walls: List of tuples defining walls/forbidden states.
+    action_index: Dict mapping each action name to its int index.
+    rewards: Read-only array defining the reward at each state.
+    terminal: Tuple of (row, col) tuples defining terminal states on the grid.
+    walls: Tuple of (row, col) tuples defining walls/forbidden states.
     slip_prob: probability of slipping perpendicular to the designated path.
     step_cost: Cost of each step (negative reward).
+    value_dtype: dtype of the model's rewards and probabilities (and so of the values
+      the numpy solvers compute); float32 halves the memory of very large maps.
+    model: Compiled TransitionModel, built on first use and cached.
+    monitor: Optional solvers.instrumentation.Monitor; step/sample calls (and
+      VecGridWorld transitions) are counted under "env_steps".
   """
-  def __init__(self, 
+  def __init__(self,
                size: tuple=(3, 4),
                terminal: list=[(0, 3), (1, 3)],
                rewards: np.array = np.array([0]),
-               walls: list = [(1,1],
+               walls: list = [(1, 1)],
                step_cost: float=-0.02,
-               slip_prob: float=0.05
+               slip_prob: float=0.05,
+               value_dtype=np.float64
                ):
     """
     Initializes an instance of the GridWorld class.
@@ -32,64 +55,314 @@ class GridWorld:
       walls: List of tuples defining where the walls/forbidden states are.
       step_cost: Cost (negative reward) for each move.
       slip_prob: Probability of slipping alonng each perpendicular direction while moving.
+      value_dtype: dtype of the compiled model's rewards and probabilities.
     """
-    self.height, self.width = size 
-    self.grid = np.zeros((self.height, self.width))
+    self.height, self.width = size
+    self._grid = None
     self.actions = ["up", "down", "left", "right"]
-    self.rewards = rewards 
+    self.action_index = {action: k for k, action in enumerate(self.actions)}
+    self._model = None
+    self.monitor = None
+    self.rewards = rewards
     self.terminal = terminal
     self.walls = walls
     self.slip_prob = slip_prob
     self.step_cost = step_cost
+    self.value_dtype = value_dtype
+
+  @classmethod
+  def from_masks(cls,
+                 wall_mask: np.array,
+                 terminal_mask: np.array,
+                 rewards: np.array,
+                 step_cost: float=-0.02,
+                 slip_prob: float=0.05,
+                 value_dtype=np.float64):
+    """
+    Builds a GridWorld from boolean [H, W] wall and terminal masks without going
+    through lists of cells; walls and terminal are only listed if accessed.
+    rewards may be a memory-mapped [H, W] array.
+    """
+    height, width = np.shape(wall_mask)
+    grid_world = cls((height, width), [], rewards, [], step_cost, slip_prob, value_dtype)
+    grid_world._wall_source = np.ascontiguousarray(wall_mask, dtype=bool).ravel()
+    grid_world._terminal_source = np.ascontiguousarray(terminal_mask, dtype=bool).ravel()
+    grid_world._walls = grid_world._terminal = None
+    return grid_world
+
+  def __getstate__(self):
+    # The compiled model is rebuilt on demand, so workers only receive the definition.
+    state = self.__dict__.copy()
+    state["_model"] = None
+    state["monitor"] = None
+    return state
+
+  @property
+  def grid(self) -> np.array:
+    if self._grid is None:
+      self._grid = np.zeros((self.height, self.width))
+    return self._grid
+
+  # Changing any of these invalidates the compiled model. They are stored
+  # immutable (walls and terminal as tuples, rewards as a read-only array) so that
+  # an in-place edit fails instead of leaving a stale model; assign a new value or
+  # use apply_changes.
+  @property
+  def rewards(self):
+    return self._rewards
+
+  @rewards.setter
+  def rewards(self, value):
+    self._rewards = _read_only(value)
+    self._model = None
+
+  # Grids built by from_masks keep walls and terminals as flat masks
+  # (_wall_source / _terminal_source) and list them on first access only.
+  @property
+  def terminal(self):
+    if self._terminal is None:
+      self._terminal = tuple(divmod(int(s), self.width) for s in np.flatnonzero(self._terminal_source))
+    return self._terminal
+
+  @terminal.setter
+  def terminal(self, value):
+    self._terminal = _cells(value)
+    self._terminal_source = None
+    self._model = None
+
+  @property
+  def walls(self):
+    if self._walls is None:
+      self._walls = tuple(divmod(int(s), self.width) for s in np.flatnonzero(self._wall_source))
+    return self._walls
+
+  @walls.setter
+  def walls(self, value):
+    self._walls = _cells(value)
+    self._wall_source = None
+    self._model = None
+
+  @property
+  def slip_prob(self):
+    return self._slip_prob
+
+  @slip_prob.setter
+  def slip_prob(self, value):
+    self._slip_prob = value
+    self._model = None
+
+  @property
+  def step_cost(self):
+    return self._step_cost
+
+  @step_cost.setter
+  def step_cost(self, value):
+    self._step_cost = value
+    self._model = None
+
+  @property
+  def value_dtype(self):
+    return self._value_dtype
+
+  @value_dtype.setter
+  def value_dtype(self, value):
+    self._value_dtype = np.dtype(value)
+    self._model = None
+
+  def invalidate_model(self):
+    """Drops the cached TransitionModel so that it is rebuilt on next use."""
+    self._model = None
+
+  def apply_changes(self,
+                    walls: dict=None,
+                    terminal: dict=None,
+                    rewards: dict=None) -> tuple:
+    """
+    Edits a few cells without invalidating the compiled model, which is patched in
+    place (see TransitionModel.patch). Afterwards walls and terminals are kept as
+    masks, as for grids built by from_masks.
+    Args:
+      walls: Dict (row, col) -> bool, True to add a wall and False to remove one.
+      terminal: Dict (row, col) -> bool, True to make the cell terminal.
+      rewards: Dict (row, col) -> new reward of the cell.
+    Returns:
+      Tuple (changed, rows): flat indices of the edited cells and of the states whose
+      model rows were rebuilt (empty if the model was not compiled yet).
+    """
+    shape = (self.height, self.width)
+    changes = [(walls or {}, "wall"), (terminal or {}, "terminal"), (rewards or {}, "reward")]
+    for cells, _ in changes:
+      for cell in cells:
+        if not (0 <= cell[0] < self.height and 0 <= cell[1] < self.width):
+          raise ValueError(f"Cell {cell} is outside the {shape} grid")
+    model = self._model
+    if model is not None:
+      wall_mask, terminal_mask = model.wall_mask.copy(), model.terminal_mask.copy()
+      reward_values = model.rewards.copy()
+    else:
+      wall_mask = cells_to_mask(self._walls, *shape) if self._wall_source is None else self._wall_source.copy()
+      terminal_mask = cells_to_mask(self._terminal, *shape) if self._terminal_source is None else self._terminal_source.copy()
+      reward_values = None
+    changed = []
+    for cells, kind in changes:
+      for cell, value in cells.items():
+        s = cell[0] * self.width + cell[1]
+        changed.append(s)
+        if kind == "wall":
+          wall_mask[s] = value
+        elif kind == "terminal":
+          terminal_mask[s] = value
+        elif reward_values is not None:
+          reward_values[s] = value
+    changed = np.unique(np.array(changed, dtype=np.int64))
+    self._wall_source, self._terminal_source = wall_mask, terminal_mask
+    self._walls = self._terminal = None
+    if rewards:
+      updated = np.array(np.broadcast_to(np.asarray(self._rewards), shape), dtype=float)
+      for cell, value in rewards.items():
+        updated[cell] = value
+      self._rewards = _read_only(updated)
+    if model is None:
+      return changed, np.array([], dtype=np.int64)
+    rows = model.patch(changed, wall_mask, terminal_mask, reward_values, self.step_cost)
+    return changed, rows
 
-  def step(self, 
-           state: tuple, 
+  @property
+  def model(self) -> TransitionModel:
+    if self._model is None:
+      shape = (self.height, self.width)
+      rewards = np.broadcast_to(np.asarray(self.rewards, dtype=self.value_dtype), shape).ravel().copy()
+      wall_mask = cells_to_mask(self._walls, *shape) if self._wall_source is None else self._wall_source.copy()
+      terminal_mask = cells_to_mask(self._terminal, *shape) if self._terminal_source is None else self._terminal_source.copy()
+      self._model = compile_model(self.height, self.width, self.actions, wall_mask, terminal_mask,
+                                  rewards, self.step_cost, self.slip_prob, self.value_dtype)
+    return self._model
+
+  @property
+  def wall_mask(self) -> np.array:
+    """Boolean [H, W] view, True for walls."""
+    return self.model.wall_mask.reshape(self.height, self.width)
+
+  @property
+  def terminal_mask(self) -> np.array:
+    """Boolean [H, W] view, True for terminal states."""
+    return self.model.terminal_mask.reshape(self.height, self.width)
+
+  @property
+  def planner(self) -> Planner:
+    """
+    Shortest-path Planner of the current model (deterministic grids only), kept
+    in model.cache so its distance fields are dropped with the model.
+    """
+    model = self.model
+    if "planner" not in model.cache:
+      model.cache["planner"] = Planner(self)
+    return model.cache["planner"]
+
+  def shortest_path(self,
+                    source: tuple,
+                    target: tuple,
+                    method: str="auto") -> tuple:
+    """
+    Cheapest path from source to target when slip_prob == 0, without solving the grid.
+    Returns:
+      Tuple (path, cost) as Planner.shortest_path: the list of states from source
+      to target (None if unreachable) and its total step cost.
+    """
+    return self.planner.shortest_path(source, target, method)
+
+  def step(self,
+           state: tuple,
            action: str):
-    numerical_action = {"up": (-1, 0),
-                        "down": (1, 0),
-                        "left": (0, -1),
-                        "right": (0, 1)
-                        }
-    if state in self.terminal: #This part makes the move for non-terminal states only.
+    if self.monitor is not None:
+      self.monitor.count("env_steps")
+    if self.terminal_mask[state]: #This part makes the move for non-terminal states only.
       return state, 0
-    new_state = state[0] + numerical_action[action][0], state[1] + numerical_action[action][1]
-    if not (0 <= new_state[0] < self.height and 0 <= new_state[1] < self.width) or new_state in self.walls:  
+    new_state = state[0] + MOVES[action][0], state[1] + MOVES[action][1]
+    if not (0 <= new_state[0] < self.height and 0 <= new_state[1] < self.width) or self.wall_mask[new_state]:
       return state, self.step_cost
     return new_state, self.step_cost
 
   def get_transition_probs(self, state, action) -> list:
-    answer = []
-    stochastic_motions = {"up": (("up", 1 - 2 * self.slip_prob), ("right", self.slip_prob), ("left", self.slip_prob)),
-                         "down": (("down", 1 - 2 * self.slip_prob), ("right", self.slip_prob), ("left", self.slip_prob)),
-                         "right": (("right", 1 - 2 * self.slip_prob), ("up", self.slip_prob), ("down", self.slip_prob)),
-                         "left": (("left", 1 - 2 * self.slip_prob), ("up", self.slip_prob), ("down", self.slip_prob)),
-                        }
-    transitions = stochastic_motions[action]
-    for act, prob in transitions:
-      new_state, reward = self.step(state, act)
-      answer.append((prob, new_state, reward))
-    return answer
-
-    def sample(self, 
-             state: tuple, 
+    model = self.model
+    s = state[0] * self.width + state[1]
+    a = self.action_index[action]
+    reward = 0 if model.terminal_mask[s] else self.step_cost
+    return [(prob, divmod(idx, self.width), reward)
+            for idx, prob in zip(model.next_idx[s, a].tolist(), model.next_prob[s, a].tolist())]
+
+  def sample(self,
+             state: tuple,
              action: str)->tuple:
     """
     Samples a step starting from a given state and action.
     Returns a tuple of the new state and the reward.
     """
+    if self.monitor is not None:
+      self.monitor.count("env_steps")
     choices = self.get_transition_probs(state, action)
     state_probs, new_states, rewards = map(list, zip(*choices))
     idx = np.random.choice([0, 1, 2], p=state_probs)
     new_state, reward = new_states[idx], rewards[idx]
-    if new_state in self.terminal:
-      reward += self.rewards[new_state]
+    if self.terminal_mask[new_state]:
+      reward += self.model.rewards[new_state[0] * self.width + new_state[1]]
+    return new_state, reward
+
+  def state_to_index(self, state: tuple) -> int:
+    return state[0] * self.width + state[1]
+
+  def index_to_state(self, idx: int) -> tuple:
+    return divmod(int(idx), self.width)
+
+  def step_index(self,
+                 state: int,
+                 action: int)->tuple:
+    """
+    Integer-indexed step: takes a flat state index and an action index.
+    Returns a tuple of the new state index and the reward.
+    """
+    if self.monitor is not None:
+      self.monitor.count("env_steps")
+    model = self.model
+    if model.terminal_mask[state]:
+      return state, 0
+    return int(model.next_state[state, action]), self.step_cost
+
+  def sample_index(self,
+                   state: int,
+                   action: int)->tuple:
+    """
+    Integer-indexed sample: takes a flat state index and an action index.
+    Returns a tuple of the new state index and the reward.
+    """
+    if self.monitor is not None:
+      self.monitor.count("env_steps")
+    model = self.model
+    u = np.random.random()
+    probs = model.next_prob[state, action]
+    outcome = 0 if u < probs[0] else (1 if u < probs[0] + probs[1] else 2)
+    new_state = int(model.next_idx[state, action, outcome])
+    reward = model.R[state, action]
+    if model.terminal_mask[new_state]:
+      reward += model.rewards[new_state]
     return new_state, reward
 
+  def policy_to_actions(self, policy: np.array) -> np.array:
+    """
+    Converts an int policy (action indices, -1 for none) into the '<U5' array of action names.
+    """
+    names = np.array(self.actions + [""], dtype='<U5')
+    return names[np.where(policy >= 0, policy, len(self.actions)).astype(int)]
+
+  def policy_from_actions(self, policy: np.array) -> np.array:
+    """
+    Converts an array of action names ("" or None for none) into an int8 policy.
+    """
+    index = np.full(policy.shape, -1, dtype=np.int8)
+    for name, k in self.action_index.items():
+      index[policy == name] = k
+    return index
+
   def get_valid_states(self)->list:
-    states = []
-    for i in range(self.height):
-      for j in range(self.width): 
-        state = (i, j)
-        if state not in self.walls:
-          states.append(state)
-    return states
+    rows, cols = np.nonzero(~self.wall_mask)
+    return list(zip(rows.tolist(), cols.tolist()))
@@ -0,0 +1,99 @@
+import numpy as np
+from .environment import GridWorld
+
+
+# Bit flags of the uint8 cell raster.
+WALL = 1
+TERMINAL = 2
+
+
+def open_array(path: str,
+               dtype=None,
+               shape: tuple=None,
+               mode: str="r") -> np.array:
+  """
+  Memory-maps an array stored as .npy or as raw binary.
+  Args:
+    path: File path; files ending in .npy are read with their header.
+    dtype: dtype of a raw file (ignored for .npy).
+    shape: Shape of a raw file (ignored for .npy).
+    mode: Memory-map mode ("r", "r+" or "c").
+  Returns:
+    numpy memmap.
+  """
+  if path.endswith(".npy"):
+    return np.load(path, mmap_mode=mode)
+  if dtype is None or shape is None:
+    raise ValueError(f"Raw file {path} needs a dtype and a shape")
+  return np.memmap(path, dtype=dtype, mode=mode, shape=tuple(shape))
+
+
+def from_raster(cells: np.array,
+                rewards: np.array=None,
+                step_cost: float=-0.02,
+                slip_prob: float=0.05,
+                value_dtype=np.float64) -> GridWorld:
+  """
+  Builds a GridWorld from a uint8 cell raster with the WALL / TERMINAL bit flags.
+  Args:
+    cells: uint8 array [H, W] (e.g. a memmap from open_array).
+    rewards: Optional float array [H, W] of state rewards; zeros if None.
+    step_cost: Cost (negative reward) for each move.
+    slip_prob: Probability of slipping along each perpendicular direction.
+    value_dtype: dtype of the compiled model, and so of the values computed by the
+      numpy solvers. With float32, pass a theta above float32 precision (e.g. 1e-6).
+  Returns:
+    Mask-backed GridWorld (see GridWorld.from_masks).
+  """
+  cells = np.asarray(cells)
+  if cells.ndim != 2:
+    raise ValueError(f"Expected a 2D cell raster, got shape {cells.shape}")
+  if rewards is None:
+    rewards = np.zeros(cells.shape, dtype=value_dtype)
+  elif np.shape(rewards) != cells.shape:
+    raise ValueError(f"rewards shape {np.shape(rewards)} does not match the raster {cells.shape}")
+  return GridWorld.from_masks((cells & WALL) != 0, (cells & TERMINAL) != 0, rewards,
+                              step_cost, slip_prob, value_dtype)
+
+
+def load_grid_world(cells_path: str,
+                    rewards_path: str=None,
+                    shape: tuple=None,
+                    step_cost: float=-0.02,
+                    slip_prob: float=0.05,
+                    value_dtype=np.float64) -> GridWorld:
+  """
+  Loads a GridWorld from a uint8 cell raster and optional float32 rewards file.
+  Both files are memory-mapped, so only the masks derived from the raster are
+  read eagerly; shape is required for raw (non-.npy) files.
+  """
+  cells = open_array(cells_path, np.uint8, shape)
+  rewards = None if rewards_path is None else open_array(rewards_path, np.float32, cells.shape)
+  return from_raster(cells, rewards, step_cost, slip_prob, value_dtype)
+
+
+def to_raster(grid_world: GridWorld) -> tuple:
+  """
+  Returns the uint8 cell raster [H, W] and float32 rewards [H, W] of a grid.
+  """
+  model = grid_world.model
+  cells = (model.wall_mask * np.uint8(WALL)) | (model.terminal_mask * np.uint8(TERMINAL))
+  shape = (grid_world.height, grid_world.width)
+  return cells.reshape(shape), model.rewards.astype(np.float32).reshape(shape)
+
+
+def save_grid_world(grid_world: GridWorld,
+                    cells_path: str,
+                    rewards_path: str=None):
+  """
+  Writes the raster format read by load_grid_world: .npy if the path ends in .npy,
+  raw binary otherwise. step_cost and slip_prob are not stored.
+  """
+  cells, rewards = to_raster(grid_world)
+  for path, array in ((cells_path, cells), (rewards_path, rewards)):
+    if path is None:
+      continue
+    if path.endswith(".npy"):
+      np.save(path, array)
+    else:
+      array.tofile(path)
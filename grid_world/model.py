@@ -0,0 +1,254 @@
+import numpy as np
+
+
+MOVES = {"up": (-1, 0),
+         "down": (1, 0),
+         "left": (0, -1),
+         "right": (0, 1)
+         }
+
+SLIPS = {"up": ("up", "right", "left"),
+         "down": ("down", "right", "left"),
+         "right": ("right", "up", "down"),
+         "left": ("left", "up", "down")
+         }
+
+
+class TransitionModel:
+  """
+  Compiled, integer-indexed dynamics of a GridWorld.
+  Every cell (i, j) gets the flat index i * width + j. Walls keep their index
+  but are masked out. Each (s, a) row holds exactly num_outcomes entries (the
+  intended move followed by the two slips), so the CSR arrays can also be
+  viewed as dense [S, A, K] blocks through next_idx and next_prob.
+  Attributes:
+    height: Number of rows in the grid.
+    width: Number of columns in the grid.
+    actions: List of action names, in index order.
+    wall_mask: Boolean array [S], True for walls.
+    terminal_mask: Boolean array [S], True for terminal states.
+    active_mask: Boolean array [S], True for states that are neither walls nor terminal.
+    rewards: Array [S] of state rewards (the value of terminal states).
+    next_state: Int array [S, A] of the deterministic successor of each move.
+    indptr: CSR row pointer [S * A + 1]; row s * A + a spans indptr[r]:indptr[r + 1].
+    indices: Int array of successor state indices.
+    data: Array of the matching transition probabilities.
+    R: Array [S, A] of expected immediate rewards.
+    cache: Scratch dict for solver artefacts (e.g. factorizations) tied to this model.
+  """
+  def __init__(self,
+               height: int,
+               width: int,
+               actions: list,
+               wall_mask: np.array,
+               terminal_mask: np.array,
+               rewards: np.array,
+               next_state: np.array,
+               indices: np.array,
+               data: np.array,
+               R: np.array):
+    self.height, self.width = height, width
+    self.actions = list(actions)
+    self.wall_mask = wall_mask
+    self.terminal_mask = terminal_mask
+    self.active_mask = ~(wall_mask | terminal_mask)
+    self.rewards = rewards
+    self.next_state = next_state
+    self.indices = indices
+    self.data = data
+    self.R = R
+    self.num_states = height * width
+    self.num_actions = len(self.actions)
+    self.num_outcomes = indices.size // (self.num_states * self.num_actions)
+    self.indptr = np.arange(0, indices.size + 1, self.num_outcomes, dtype=np.int64)
+    self._predecessors = None
+    self.cache = {}
+
+  @property
+  def next_idx(self) -> np.array:
+    """Successor indices as an [S, A, K] view."""
+    return self.indices.reshape(self.num_states, self.num_actions, self.num_outcomes)
+
+  @property
+  def next_prob(self) -> np.array:
+    """Transition probabilities as an [S, A, K] view."""
+    return self.data.reshape(self.num_states, self.num_actions, self.num_outcomes)
+
+  def predecessors(self) -> tuple:
+    """
+    Reverse index of the dynamics, built on first use.
+    Returns:
+      Tuple (indptr, indices) in CSR form: the active states that can reach state s
+      in one step are indices[indptr[s]:indptr[s + 1]].
+    """
+    if self._predecessors is None:
+      sources = np.repeat(np.arange(self.num_states, dtype=np.int64), self.num_actions * self.num_outcomes)
+      keep = (self.data > 0) & self.active_mask[sources]
+      pairs = np.unique(self.indices[keep].astype(np.int64) * self.num_states + sources[keep])
+      targets, sources = np.divmod(pairs, self.num_states)
+      indptr = np.zeros(self.num_states + 1, dtype=np.int64)
+      np.cumsum(np.bincount(targets, minlength=self.num_states), out=indptr[1:])
+      self._predecessors = (indptr, sources.astype(np.int32))
+    return self._predecessors
+
+  def predecessors_of(self, states: np.array) -> np.array:
+    """
+    Returns the sorted, unique active states that can reach any of the given states in one step.
+    """
+    indptr, indices = self.predecessors()
+    states = np.asarray(states, dtype=np.int64)
+    starts = indptr[states]
+    counts = indptr[states + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return np.unique(indices[offsets])
+
+  def neighbours(self, states: np.array) -> np.array:
+    """Returns the sorted, unique states and their in-bounds 4-neighbours."""
+    states = np.asarray(states, dtype=np.int64)
+    rows, cols = np.divmod(states, self.width)
+    cells = [states]
+    for di, dj in MOVES.values():
+      inside = (0 <= rows + di) & (rows + di < self.height) & (0 <= cols + dj) & (cols + dj < self.width)
+      cells.append(states[inside] + di * self.width + dj)
+    return np.unique(np.concatenate(cells))
+
+  def patch(self,
+            states: np.array,
+            wall_mask: np.array,
+            terminal_mask: np.array,
+            rewards: np.array,
+            step_cost: float) -> np.array:
+    """
+    Updates the model in place after the given states changed, instead of recompiling.
+    The flags and rewards of states are copied from the full-size masks and rewards,
+    and the rows of states and their neighbours (the only moves a wall or terminal
+    can affect) are rebuilt. A built predecessor index is patched by splicing the
+    rebuilt target lists in, which costs one copy of the index but no re-sort; cache
+    is cleared.
+    Args:
+      states: Flat indices of the changed cells.
+      wall_mask: Flat boolean mask of the walls after the change.
+      terminal_mask: Flat boolean mask of the terminal states after the change.
+      rewards: Flat array of the state rewards after the change.
+      step_cost: Cost (negative reward) for each move.
+    Returns:
+      Sorted array of the states whose rows were rebuilt.
+    """
+    states = np.asarray(states, dtype=np.int64)
+    self.wall_mask[states] = wall_mask[states]
+    self.terminal_mask[states] = terminal_mask[states]
+    self.active_mask[states] = ~(self.wall_mask[states] | self.terminal_mask[states])
+    self.rewards[states] = rewards[states]
+    rows = self.neighbours(states)
+    old_targets = self.next_idx[rows].ravel()
+    self.next_state[rows] = successors(rows, self.height, self.width, self.actions, self.wall_mask, self.terminal_mask)
+    self.next_idx[rows] = self.next_state[rows][:, outcome_columns(self.actions)]
+    self.R[rows] = np.where(self.terminal_mask[rows], 0.0, float(step_cost))[:, None]
+    if self._predecessors is not None:
+      self._patch_predecessors(np.unique(np.concatenate([old_targets, self.next_idx[rows].ravel()])))
+    self.cache.clear()
+    return rows
+
+  def _patch_predecessors(self, targets: np.array):
+    """Recomputes the predecessor lists of targets; a predecessor is always a neighbour."""
+    indptr, indices = self._predecessors
+    candidates = self.neighbours(targets)
+    idx, prob = self.next_idx[candidates], self.next_prob[candidates]
+    reached = np.zeros(self.num_states, dtype=bool)
+    reached[targets] = True
+    keep = (prob > 0) & reached[idx] & self.active_mask[candidates][:, None, None]
+    sources = np.broadcast_to(candidates[:, None, None], idx.shape)[keep]
+    pairs = np.unique(idx[keep].astype(np.int64) * self.num_states + sources)
+    pair_targets, pair_sources = np.divmod(pairs, self.num_states)
+    counts = np.bincount(pair_targets, minlength=self.num_states)[targets]
+    # Lists between two patched targets move over as one block.
+    blocks, start = [], 0
+    for target, new_sources in zip(targets.tolist(), np.split(pair_sources, np.cumsum(counts)[:-1])):
+      blocks += [indices[start:indptr[target]], new_sources.astype(indices.dtype)]
+      start = indptr[target + 1]
+    blocks.append(indices[start:])
+    shift = np.zeros(self.num_states + 1, dtype=np.int64)
+    shift[targets + 1] = counts - (indptr[targets + 1] - indptr[targets])
+    self._predecessors = (indptr + np.cumsum(shift), np.concatenate(blocks))
+
+  def state_index(self, state: tuple) -> int:
+    return state[0] * self.width + state[1]
+
+  def index_state(self, idx: int) -> tuple:
+    return divmod(int(idx), self.width)
+
+
+def cells_to_mask(cells: list, height: int, width: int) -> np.array:
+  """
+  Converts a list of (row, col) tuples into a flat boolean mask of size height * width.
+  """
+  mask = np.zeros(height * width, dtype=bool)
+  if len(cells):
+    cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+    mask[cells[:, 0] * width + cells[:, 1]] = True
+  return mask
+
+
+def successors(states: np.array,
+               height: int,
+               width: int,
+               actions: list,
+               wall_mask: np.array,
+               terminal_mask: np.array) -> np.array:
+  """
+  Deterministic successor of every action from the given flat states.
+  Returns:
+    Int array [len(states), A]; blocked moves and terminal states stay in place.
+  """
+  states = np.asarray(states, dtype=np.int32)
+  rows, cols = np.divmod(states, width)
+  next_state = np.empty((states.size, len(actions)), dtype=np.int32)
+  for k, action in enumerate(actions):
+    di, dj = MOVES[action]
+    new_rows, new_cols = rows + di, cols + dj
+    inside = (0 <= new_rows) & (new_rows < height) & (0 <= new_cols) & (new_cols < width)
+    target = np.where(inside, new_rows * width + new_cols, states)
+    blocked = ~inside | wall_mask[target]
+    next_state[:, k] = np.where(blocked, states, target)
+  terminal = terminal_mask[states]
+  next_state[terminal] = states[terminal, None] #Terminal states absorb every move.
+  return next_state
+
+
+def outcome_columns(actions: list) -> list:
+  """For each action, the action indices of its outcomes (the move, then the two slips)."""
+  return [[actions.index(slip) for slip in SLIPS[action]] for action in actions]
+
+
+def compile_model(height: int,
+                  width: int,
+                  actions: list,
+                  wall_mask: np.array,
+                  terminal_mask: np.array,
+                  rewards: np.array,
+                  step_cost: float,
+                  slip_prob: float,
+                  dtype=np.float64) -> TransitionModel:
+  """
+  Builds the TransitionModel of a grid in a handful of array operations.
+  Args:
+    height: Number of rows in the grid.
+    width: Number of columns in the grid.
+    actions: List of action names, keys of MOVES.
+    wall_mask: Flat boolean mask of the walls.
+    terminal_mask: Flat boolean mask of the terminal states.
+    rewards: Flat array of the state rewards.
+    step_cost: Cost (negative reward) for each move.
+    slip_prob: Probability of slipping along each perpendicular direction.
+    dtype: Float dtype of the probabilities, rewards and R.
+  Returns:
+    TransitionModel with the same semantics as GridWorld.get_transition_probs.
+  """
+  num_states = height * width
+  next_state = successors(np.arange(num_states, dtype=np.int32), height, width, actions, wall_mask, terminal_mask)
+  outcome_probs = np.array([1 - 2 * slip_prob, slip_prob, slip_prob], dtype=dtype)
+  indices = np.ascontiguousarray(next_state[:, outcome_columns(actions)]).ravel()
+  data = np.ascontiguousarray(np.broadcast_to(outcome_probs, (num_states, len(actions), 3))).ravel()
+  R = np.repeat(np.where(terminal_mask, 0.0, float(step_cost)).astype(dtype)[:, None], len(actions), axis=1)
+  return TransitionModel(height, width, actions, wall_mask, terminal_mask, np.asarray(rewards, dtype=dtype),
+                         next_state, indices, data, R)
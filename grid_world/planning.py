@@ -0,0 +1,213 @@
+import heapq
+from collections import OrderedDict
+import numpy as np
+from .model import MOVES
+
+UNREACHABLE = -1
+
+
+class Planner:
+  """
+  Point-to-point shortest paths on a deterministic (slip_prob == 0) GridWorld.
+  Every move costs |step_cost|, so the cheapest path is the one with the fewest
+  moves; paths never pass through a terminal state other than the target.
+  Distance fields (moves to a target from every cell) are built by a reverse
+  breadth-first search over the model's next_state table and kept in an LRU
+  cache keyed by target, so once a target is known any number of sources are
+  answered by array lookups.
+  Attributes:
+    model: Compiled TransitionModel of the grid.
+    step_cost: Cost (negative reward) of each move.
+    cache_size: Number of distance fields kept.
+    hits, misses: Distance field cache counters.
+  """
+  def __init__(self,
+               grid_world,
+               cache_size: int=8):
+    if grid_world.slip_prob != 0:
+      raise ValueError(f"Planning needs deterministic moves, got slip_prob={grid_world.slip_prob}")
+    self.model = grid_world.model
+    self.step_cost = grid_world.step_cost
+    self.cache_size = cache_size
+    self._fields = OrderedDict() #target -> (distance [S], next action [S])
+    self.hits = self.misses = 0
+    width = self.model.width
+    offsets = {action: di * width + dj for action, (di, dj) in MOVES.items()}
+    # For each action a, the move that undoes it: s reaches s + offset[a] with a.
+    self._offsets = np.array([offsets[action] for action in self.model.actions], dtype=np.int64)
+
+  def _index(self, state) -> int:
+    return self.model.state_index(state) if isinstance(state, tuple) else int(state)
+
+  def _field(self, target: int) -> tuple:
+    entry = self._fields.get(target)
+    if entry is not None:
+      self._fields.move_to_end(target)
+      self.hits += 1
+      return entry
+    self.misses += 1
+    entry = self._reverse_bfs(target)
+    self._fields[target] = entry
+    while len(self._fields) > self.cache_size:
+      self._fields.popitem(last=False)
+    return entry
+
+  def _reverse_bfs(self, target: int) -> tuple:
+    """
+    Level-synchronous BFS from target along reversed moves. Each level looks at
+    the four neighbours of the frontier and keeps the active cells whose move
+    lands on the frontier cell it came from.
+    Returns:
+      Tuple (distance, action): int32 [S] moves to target (UNREACHABLE if none)
+      and int8 [S] first action of a shortest path (-1 at the target and
+      unreachable cells).
+    """
+    model = self.model
+    distance = np.full(model.num_states, UNREACHABLE, dtype=np.int32)
+    action = np.full(model.num_states, -1, dtype=np.int8)
+    distance[target] = 0
+    frontier = np.array([target], dtype=np.int64)
+    level = 0
+    while frontier.size:
+      level += 1
+      # Candidate predecessor of f by action a is f - offset[a].
+      sources = (frontier[:, None] - self._offsets).ravel()
+      actions = np.tile(np.arange(model.num_actions, dtype=np.int8), frontier.size)
+      targets = np.repeat(frontier, model.num_actions)
+      inside = (sources >= 0) & (sources < model.num_states)
+      sources, actions, targets = sources[inside], actions[inside], targets[inside]
+      keep = ((distance[sources] == UNREACHABLE) & model.active_mask[sources]
+              & (model.next_state[sources, actions] == targets)) #Also rejects row wrap-around.
+      sources, actions = sources[keep], actions[keep]
+      sources, first = np.unique(sources, return_index=True)
+      distance[sources] = level
+      action[sources] = actions[first]
+      frontier = sources
+    return distance, action
+
+  def distance_field(self, target) -> np.array:
+    """
+    Returns the int32 [H, W] number of moves from every cell to target
+    (UNREACHABLE where the target cannot be reached). The array is shared
+    with the cache; copy it before modifying.
+    """
+    return self._field(self._index(target))[0].reshape(self.model.height, self.model.width)
+
+  def distances(self,
+                sources: list,
+                target) -> np.array:
+    """
+    Many-to-one query: moves from each source to target in one lookup
+    (UNREACHABLE where there is no path).
+    """
+    distance = self._field(self._index(target))[0]
+    return distance[[self._index(source) for source in sources]]
+
+  def next_action(self,
+                  source,
+                  target) -> int:
+    """Returns the action index of the first move of a shortest path, or -1."""
+    return int(self._field(self._index(target))[1][self._index(source)])
+
+  def shortest_path(self,
+                    source,
+                    target,
+                    method: str="auto") -> tuple:
+    """
+    Finds a shortest path from source to target.
+    Args:
+      source: Start state, a (row, col) tuple or a flat index.
+      target: Goal state, a (row, col) tuple or a flat index.
+      method: "field" follows the (cached or newly built) distance field of target,
+        "astar" runs A* with the Manhattan heuristic, "dijkstra" runs it without a
+        heuristic and "bfs" runs a plain breadth-first search. "auto" uses the
+        distance field if target is cached and A* otherwise.
+    Returns:
+      Tuple (path, cost): path is the list of (row, col) states from source to
+      target (None if unreachable) and cost its total step cost.
+    """
+    source, target = self._index(source), self._index(target)
+    if method == "auto":
+      method = "field" if target in self._fields else "astar"
+    if method == "field":
+      path = self._follow_field(source, target)
+    elif method in ("astar", "dijkstra"):
+      path = self._astar(source, target, method == "astar")
+    elif method == "bfs":
+      path = self._bfs(source, target)
+    else:
+      raise ValueError(f"Unknown method: {method}")
+    if path is None:
+      return None, None
+    return [self.model.index_state(s) for s in path], (len(path) - 1) * self.step_cost
+
+  def _follow_field(self, source: int, target: int) -> list:
+    distance, action = self._field(target)
+    if distance[source] == UNREACHABLE:
+      return None
+    path = [source]
+    next_state = self.model.next_state
+    for _ in range(distance[source]):
+      path.append(int(next_state[path[-1], action[path[-1]]]))
+    return path
+
+  def _moves(self, s: int, target: int) -> list:
+    """Successors of s; terminal states other than target are dead ends."""
+    if s != target and self.model.terminal_mask[s]:
+      return []
+    return self.model.next_state[s].tolist()
+
+  def _astar(self, source: int, target: int, heuristic: bool) -> list:
+    """
+    A* over the next_state table. Costs are in units of |step_cost|, which is
+    the same for every move, so the Manhattan distance is admissible and ties
+    are broken towards the deeper node.
+    """
+    width = self.model.width
+    target_row, target_col = divmod(target, width)
+
+    def h(s):
+      if not heuristic:
+        return 0
+      row, col = divmod(s, width)
+      return abs(row - target_row) + abs(col - target_col)
+
+    parent = {source: source}
+    g = {source: 0}
+    heap = [(h(source), 0, source)]
+    while heap:
+      _, neg_g, s = heapq.heappop(heap)
+      if s == target:
+        return self._unwind(parent, target)
+      if -neg_g > g[s]:
+        continue #Stale entry.
+      for s_new in self._moves(s, target):
+        cost = g[s] + 1
+        if cost < g.get(s_new, cost + 1):
+          g[s_new], parent[s_new] = cost, s
+          heapq.heappush(heap, (cost + h(s_new), -cost, s_new))
+    return None
+
+  def _bfs(self, source: int, target: int) -> list:
+    parent = {source: source}
+    frontier = [source]
+    while frontier and target not in parent:
+      next_frontier = []
+      for s in frontier:
+        for s_new in self._moves(s, target):
+          if s_new not in parent:
+            parent[s_new] = s
+            next_frontier.append(s_new)
+      frontier = next_frontier
+    return self._unwind(parent, target) if target in parent else None
+
+  @staticmethod
+  def _unwind(parent: dict, target: int) -> list:
+    path = [target]
+    while parent[path[-1]] != path[-1]:
+      path.append(parent[path[-1]])
+    return path[::-1]
+
+  def clear(self):
+    """Drops the cached distance fields."""
+    self._fields.clear()
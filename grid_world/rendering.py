@@ -0,0 +1,265 @@
+import struct
+import zlib
+import numpy as np
+
+ACTION_SYMBOLS = {"up": "↑",
+                  "down": "↓",
+                  "right": "→",
+                  "left": "←",
+                  }
+
+# Anchor colours of the heatmap palette (dark blue -> teal -> yellow), low to high.
+PALETTE_ANCHORS = np.array([[68, 1, 84], [59, 82, 139], [33, 145, 140], [94, 201, 98], [253, 231, 37]])
+MASK_COLOUR = (40, 40, 40)
+
+
+def downsample(array: np.array,
+               shape: tuple,
+               how: str="mean") -> np.array:
+  """
+  Shrinks a 2D array to at most shape = (rows, cols) by reducing square-ish blocks.
+  Args:
+    array: Array [H, W]; NaN entries are ignored by "mean" and "max".
+    shape: Largest (rows, cols) of the result.
+    how: "mean" or "max" of each block, or "first" to take its top-left cell
+      (for categorical data such as policies).
+  Returns:
+    Array [ceil(H / fy), ceil(W / fx)] where fy, fx are the block sizes; the input
+    itself if it already fits.
+  """
+  height, width = array.shape
+  fy, fx = -(-height // shape[0]), -(-width // shape[1])
+  if fy == fx == 1:
+    return array
+  if how == "first":
+    return array[::fy, ::fx]
+  if how not in ("mean", "max"):
+    raise ValueError(f"Unknown reduction: {how}")
+  rows, cols = -(-height // fy), -(-width // fx)
+  if (rows * fy, cols * fx) == (height, width):
+    blocks = np.asarray(array, dtype=float).reshape(rows, fy, cols, fx)
+  else:
+    padded = np.full((rows * fy, cols * fx), np.nan)
+    padded[:height, :width] = array
+    blocks = padded.reshape(rows, fy, cols, fx)
+  if how == "max":
+    return np.fmax.reduce(np.fmax.reduce(blocks, axis=3), axis=1)
+  if not np.isnan(blocks).any():
+    return blocks.mean(axis=(1, 3))
+  valid = ~np.isnan(blocks)
+  counts = valid.sum(axis=(1, 3))
+  sums = np.where(valid, blocks, 0.0).sum(axis=(1, 3))
+  return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def _block_size(shape: tuple, viewport: tuple) -> tuple:
+  return -(-shape[0] // viewport[0]), -(-shape[1] // viewport[1])
+
+
+def _crop(array: np.array, region: tuple) -> np.array:
+  if region is None:
+    return array
+  (r0, r1), (c0, c1) = region
+  return array[r0:r1, c0:c1]
+
+
+def _table(cells: np.array,
+           header: str=None) -> str:
+  """Joins a 2D array of cell strings into "|a|b|" rows in one pass."""
+  lines = ["|" + "|".join(row) + "|" for row in cells.tolist()]
+  return "\n".join(lines if header is None else [header] + lines)
+
+
+def _header(shape: tuple, viewport: tuple, how: str) -> str:
+  if viewport is None:
+    return None
+  fy, fx = _block_size(shape, viewport)
+  if fy == fx == 1:
+    return None
+  return f"{shape[0]}x{shape[1]} grid, {fy}x{fx} cells per entry ({how})"
+
+
+def render_values(V: np.array,
+                  viewport: tuple=(40, 16),
+                  region: tuple=None,
+                  fmt: str="%.3f",
+                  cell_width: int=7) -> str:
+  """
+  Formats state values as a text table in one vectorized pass.
+  Args:
+    V: Array [H, W] of state values.
+    viewport: Largest (rows, cols) shown; bigger grids are block-averaged and
+      get a header line with the block size. None shows every cell.
+    region: Optional ((row_start, row_stop), (col_start, col_stop)) to zoom into
+      before downsampling.
+    fmt: printf-style format of a value.
+    cell_width: Values are centred in cells of this many characters.
+  Returns:
+    The table as one string.
+  """
+  V = _crop(np.asarray(V, dtype=float), region)
+  cells = np.char.mod(fmt, V if viewport is None else downsample(V, viewport, "mean"))
+  pad = np.maximum(cell_width - np.char.str_len(cells), 0)
+  spaces = np.array([" " * k for k in range(cell_width + 1)])
+  cells = np.char.add(np.char.add(spaces[pad // 2], cells), spaces[pad - pad // 2]) #Extra space on the right, as format's "^".
+  return _table(cells, _header(V.shape, viewport, "mean"))
+
+
+def render_policy(grid_world,
+                  policy: np.array,
+                  viewport: tuple=(40, 16),
+                  region: tuple=None) -> str:
+  """
+  Formats a deterministic policy as a text table of arrows in one vectorized pass:
+  terminal states show "o", walls and states without an action a blank. Bigger
+  grids than viewport show the top-left cell of each block.
+  Args:
+    grid_world: An instance of the GridWorld class.
+    policy: Array [H, W] of int action indices (-1 for none) or action names.
+    viewport: Largest (rows, cols) shown, or None for every cell.
+    region: Optional ((row_start, row_stop), (col_start, col_stop)) to zoom into.
+  Returns:
+    The table as one string.
+  """
+  policy = np.asarray(policy)
+  if policy.dtype.kind not in "iuf":
+    policy = grid_world.policy_from_actions(policy)
+  symbols = np.array([f"   {ACTION_SYMBOLS[action]}   " for action in grid_world.actions] + [" " * 7, "   o   "])
+  codes = np.where(policy >= 0, policy, len(grid_world.actions)).astype(int)
+  codes[grid_world.terminal_mask] = len(grid_world.actions) + 1
+  codes = _crop(codes, region)
+  shown = codes if viewport is None else downsample(codes, viewport, "first")
+  return _table(symbols[shown], _header(codes.shape, viewport, "top-left"))
+
+
+def colorize(V: np.array,
+             mask: np.array=None,
+             vmin: float=None,
+             vmax: float=None) -> np.array:
+  """
+  Maps values to RGB through the heatmap palette.
+  Args:
+    V: Array [H, W] of values; NaN entries are drawn like masked ones.
+    mask: Optional boolean [H, W], True for cells drawn in MASK_COLOUR (e.g. walls).
+    vmin, vmax: Value range of the palette; defaults to the range of the unmasked values.
+  Returns:
+    uint8 array [H, W, 3].
+  """
+  V = np.asarray(V, dtype=float)
+  hidden = np.isnan(V) if mask is None else (np.isnan(V) | mask)
+  shown = V[~hidden]
+  if vmin is None:
+    vmin = float(shown.min()) if shown.size else 0.0
+  if vmax is None:
+    vmax = float(shown.max()) if shown.size else 1.0
+  positions = np.linspace(0, 255, len(PALETTE_ANCHORS))
+  palette = np.stack([np.interp(np.arange(256), positions, PALETTE_ANCHORS[:, c]) for c in range(3)], axis=1)
+  palette = palette.round().astype(np.uint8)
+  scaled = (np.nan_to_num(V, nan=vmin) - vmin) / (vmax - vmin) if vmax > vmin else np.zeros(V.shape)
+  rgb = palette[np.clip(scaled * 255, 0, 255).astype(np.uint8)]
+  rgb[hidden] = MASK_COLOUR
+  return rgb
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+  return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+
+def write_image(path: str,
+                rgb: np.array,
+                compression: int=6):
+  """
+  Writes a uint8 [H, W, 3] array as PNG (zlib, no filtering) or, for paths ending
+  in .ppm, as binary PPM.
+  """
+  rgb = np.ascontiguousarray(rgb, dtype=np.uint8)
+  height, width, _ = rgb.shape
+  with open(path, "wb") as f:
+    if path.endswith(".ppm"):
+      f.write(b"P6\n%d %d\n255\n" % (width, height))
+      f.write(rgb.tobytes())
+      return
+    rows = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgb.reshape(height, width * 3)], axis=1) #Filter byte 0 per row.
+    f.write(b"\x89PNG\r\n\x1a\n")
+    f.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+    f.write(_png_chunk(b"IDAT", zlib.compress(rows.tobytes(), compression)))
+    f.write(_png_chunk(b"IEND", b""))
+
+
+def save_heatmap(path: str,
+                 V: np.array,
+                 grid_world=None,
+                 vmin: float=None,
+                 vmax: float=None,
+                 max_shape: tuple=(2048, 2048),
+                 scale: int=1):
+  """
+  Writes the values as a heatmap image (PNG, or PPM if path ends in .ppm).
+  Args:
+    path: Output file.
+    V: Array [H, W] of state values.
+    grid_world: Optional GridWorld whose walls are drawn in MASK_COLOUR.
+    vmin, vmax: Value range of the palette.
+    max_shape: Larger grids are block-averaged down to at most this many pixels.
+    scale: Pixels per cell side (after downsampling).
+  """
+  V = np.asarray(V, dtype=float)
+  if grid_world is not None:
+    V = np.where(grid_world.wall_mask, np.nan, V)
+  rgb = colorize(downsample(V, max_shape, "mean"), vmin=vmin, vmax=vmax)
+  write_image(path, np.repeat(np.repeat(rgb, scale, axis=0), scale, axis=1))
+
+
+def arrow_glyphs(size: int) -> np.array:
+  """
+  Boolean [6, size, size] pixel masks of the up, down, left and right arrows, a
+  blank and a terminal dot, in that order.
+  """
+  right = np.zeros((size, size), dtype=bool)
+  mid, tip = size // 2, size - 1 - size // 5
+  right[mid, size // 5:tip + 1] = True
+  for k in range(1, size // 4 + 1):
+    right[mid - k, tip - k] = right[mid + k, tip - k] = True
+  dot = np.zeros((size, size), dtype=bool)
+  dot[size // 3:size - size // 3, size // 3:size - size // 3] = True
+  glyphs = {"up": np.rot90(right, 1), "down": np.rot90(right, 3), "left": np.rot90(right, 2), "right": right}
+  return np.stack([glyphs[action] for action in ("up", "down", "left", "right")] + [np.zeros_like(right), dot])
+
+
+def save_arrow_field(path: str,
+                     grid_world,
+                     policy: np.array,
+                     V: np.array=None,
+                     cell: int=9,
+                     max_shape: tuple=(256, 256),
+                     colour: tuple=(255, 255, 255)):
+  """
+  Writes the policy as an image of arrows, one cell x cell glyph per grid cell, over
+  the value heatmap if V is given (PNG, or PPM if path ends in .ppm).
+  Args:
+    path: Output file.
+    grid_world: An instance of the GridWorld class.
+    policy: Array [H, W] of int action indices (-1 for none) or action names.
+    V: Optional array [H, W] of state values for the background.
+    cell: Glyph size in pixels.
+    max_shape: Larger grids show the top-left cell's action of each block (and
+      the block-averaged value) so that at most this many glyphs are drawn.
+    colour: RGB of the arrows.
+  """
+  policy = np.asarray(policy)
+  if policy.dtype.kind not in "iuf":
+    policy = grid_world.policy_from_actions(policy)
+  glyph_index = {action: k for k, action in enumerate(("up", "down", "left", "right"))}
+  to_glyph = np.array([glyph_index[action] for action in grid_world.actions] + [4])
+  codes = to_glyph[np.where(policy >= 0, policy, len(grid_world.actions)).astype(int)]
+  codes[grid_world.terminal_mask] = 5
+  codes = downsample(codes, max_shape, "first")
+  rows, cols = codes.shape
+  pixels = arrow_glyphs(cell)[codes].transpose(0, 2, 1, 3).reshape(rows * cell, cols * cell)
+  if V is None:
+    background = np.zeros((rows, cols, 3), dtype=np.uint8)
+  else:
+    background = colorize(downsample(np.where(grid_world.wall_mask, np.nan, V), max_shape, "mean"))
+  rgb = np.repeat(np.repeat(background, cell, axis=0), cell, axis=1)
+  rgb[pixels] = colour
+  write_image(path, rgb)
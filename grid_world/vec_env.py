@@ -0,0 +1,95 @@
+import numpy as np
+from .environment import GridWorld
+
+
+class VecGridWorld:
+  """
+  Steps many independent agents on the same GridWorld at once.
+  States are flat int indices (i * width + j) and actions are int indices into
+  grid_world.actions. Every step draws all slip outcomes with a single RNG call
+  and resolves walls, bounds and terminals through the compiled model's tables.
+  Attributes:
+    grid_world: The underlying GridWorld instance.
+    num_envs: Number of agents stepped together.
+    states: Int array [num_envs] of the current state of each agent.
+    steps: Int array [num_envs] of steps taken in the current episode.
+    max_steps: Optional episode length after which agents are truncated and reset.
+    rng: numpy Generator used for slips and resets.
+  """
+  def __init__(self,
+               grid_world: GridWorld,
+               num_envs: int=64,
+               start_states: np.array=None,
+               max_steps: int=None,
+               seed: int=None):
+    """
+    Initializes a batch of num_envs agents.
+    Args:
+      grid_world: Instance of GridWorld class.
+      num_envs: Number of agents.
+      start_states: Flat indices to draw reset states from; defaults to every
+        state that is neither a wall nor terminal.
+      max_steps: Optional maximum episode length.
+      seed: Seed (or SeedSequence) for the random generator.
+    """
+    model = grid_world.model
+    self.grid_world = grid_world
+    self.num_envs = num_envs
+    self.max_steps = max_steps
+    self.rng = np.random.default_rng(seed)
+    self._next_idx = model.next_idx
+    self._thresholds = np.cumsum(model.next_prob, axis=2)[:, :, :-1]
+    self._step_reward = model.R
+    self._arrival_reward = np.where(model.terminal_mask, model.rewards, 0.0)
+    self._terminal = model.terminal_mask
+    if start_states is None:
+      start_states = np.flatnonzero(model.active_mask)
+    self._start_states = np.atleast_1d(np.asarray(start_states, dtype=np.int64))
+    self.states = np.empty(num_envs, dtype=np.int64)
+    self.steps = np.zeros(num_envs, dtype=np.int64)
+    self.reset()
+
+  def reset(self, mask: np.array=None) -> np.array:
+    """
+    Resets all agents, or only those selected by the boolean mask.
+    Returns the current states of every agent.
+    """
+    if mask is None:
+      mask = np.ones(self.num_envs, dtype=bool)
+    n = int(np.count_nonzero(mask))
+    self.states[mask] = self._start_states[self.rng.integers(len(self._start_states), size=n)]
+    self.steps[mask] = 0
+    return self.states
+
+  def sample(self,
+             states: np.array,
+             actions: np.array) -> tuple:
+    """
+    Samples one transition for each (state, action) pair, with the same rewards as GridWorld.sample.
+    Returns a tuple of the new states and the rewards.
+    """
+    if self.grid_world.monitor is not None:
+      self.grid_world.monitor.count("env_steps", len(states))
+    u = self.rng.random(len(states))
+    outcome = np.sum(u[:, None] >= self._thresholds[states, actions], axis=1)
+    new_states = self._next_idx[states, actions, outcome]
+    rewards = self._step_reward[states, actions] + self._arrival_reward[new_states]
+    return new_states, rewards
+
+  def step(self,
+           actions: np.array) -> tuple:
+    """
+    Moves every agent by one action. Agents that reach a terminal state (or run
+    out of max_steps) are reset, so self.states already holds their new start.
+    Returns:
+      Tuple of the new states (before any reset), rewards and done flags.
+    """
+    new_states, rewards = self.sample(self.states, actions)
+    dones = self._terminal[new_states]
+    self.steps += 1
+    if self.max_steps is not None:
+      dones |= self.steps >= self.max_steps
+    self.states[:] = new_states
+    if dones.any():
+      self.reset(dones)
+    return new_states, rewards, dones
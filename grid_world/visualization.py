@@ -1,46 +1,40 @@
 import numpy as np
 from .environment import GridWorld
+from .rendering import render_policy, render_values
 
 
-def show_values(grid_world, V):
+def show_values(grid_world,
+                V,
+                viewport: tuple=None,
+                region: tuple=None):
   """
   Renders a basic visualization of the state values for every position.
   Parameters:
     grid_world: An instance of the GridWorld class.
     V: Corresponding state values.
+    viewport: Optional largest (rows, cols) printed; bigger grids are block-averaged.
+      By default every cell is printed.
+    region: Optional ((row_start, row_stop), (col_start, col_stop)) to zoom into.
   Returns:
     None
   """
-  n_rows, n_cols = grid_world.height, grid_world.width
-  for i in range(n_rows):
-    row = "|"
-    for j in range(n_cols):
-      row += f"{V[i,j]:^7.3f}" +"|"
-    print(row)
+  print(render_values(V, viewport, region))
 
 
-def show_policy(grid_world, policy):
+def show_policy(grid_world,
+                policy,
+                viewport: tuple=None,
+                region: tuple=None):
   """
   Renders a basic visualization of the given policy for every position.
   Parameters:
     grid_world: An instance of the GridWorld class.
-    policy: Corresponding deterministic policy.
+    policy: Corresponding deterministic policy, either int action indices
+      (-1 where there is no action) or action names.
+    viewport: Optional largest (rows, cols) printed; bigger grids show one cell per
+      block. By default every cell is printed.
+    region: Optional ((row_start, row_stop), (col_start, col_stop)) to zoom into.
   Returns:
     None
   """
-  action_symbols = {"up": "\u2191",
-                    "down": "\u2193",
-                    "right": "\u2192",
-                    "left": "\u2190",
-                    "stay": "o"
-                    }
-  n_rows, n_cols = grid_world.height, grid_world.width
-  for i in range(n_rows):
-    row = "|"
-    for j in range(n_cols):
-      if (i, j) not in grid_world.terminal:
-        row += f"   {action_symbols[policy[i,j]]}   " +"|"
-      else: 
-        row += f"   {action_symbols["stay"]}   " +"|"
-    print(row)
-
+  print(render_policy(grid_world, policy, viewport, region))
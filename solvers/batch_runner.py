@@ -0,0 +1,177 @@
+"""
+asyncio front end for solving many GridWorld scenarios on a process pool.
+A scenario is a dict:
+  {"id": ..., "size": (H, W), "terminal": [...], "rewards": ..., "walls": [...],
+   "step_cost": ..., "slip_prob": ...,                  #GridWorld arguments, or
+   "grid_world": GridWorld,                             #a ready-made instance
+   "solver": "value_iteration" | "policy_iteration",    #default "value_iteration"
+   "params": {"gamma": ..., ...},                       #solver keyword arguments
+   "timeout": seconds}                                  #optional, overrides the runner's
+Example:
+  async with BatchRunner(max_workers=8, timeout=60) as runner:
+    async for scenario_id, V, policy, stats in runner.run(scenarios):
+      ...
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from grid_world.environment import GridWorld
+from solvers.batched import batched_value_iteration
+from solvers.policy_iteration import policy_iteration
+from solvers.value_iteration import value_iteration
+
+SOLVERS = {"value_iteration": value_iteration,
+           "policy_iteration": policy_iteration,
+           }
+
+_GRID_WORLD_ARGS = ("size", "terminal", "rewards", "walls", "step_cost", "slip_prob")
+
+
+def scenario_grid_world(scenario: dict) -> GridWorld:
+  if "grid_world" in scenario:
+    return scenario["grid_world"]
+  return GridWorld(**{key: scenario[key] for key in _GRID_WORLD_ARGS if key in scenario})
+
+
+def _solve_one(scenario: dict) -> list:
+  solver = SOLVERS[scenario.get("solver", "value_iteration")]
+  params = dict(scenario.get("params", {}), return_stats=True)
+  V, policy, stats = solver(scenario_grid_world(scenario), **params)
+  return [(scenario["id"], V, policy, stats)]
+
+
+def _solve_stack(scenarios: list) -> list:
+  params = [s.get("params", {}) for s in scenarios]
+  grid_worlds = [scenario_grid_world(s) for s in scenarios]
+  results, stats = batched_value_iteration(grid_worlds,
+                                           [p.get("gamma", 0.9) for p in params],
+                                           [p.get("theta", 1e-10) for p in params],
+                                           return_stats=True)
+  #The keys of value_iteration's stats, plus the number of scenarios stacked together.
+  return [(scenario["id"], V, policy, {"mode": "jacobi", "iterations": stats["iterations"][k],
+                                       "backups": stats["iterations"][k] * int(np.count_nonzero(g.model.active_mask)),
+                                       "residual": stats["residuals"][k], "batched": len(scenarios)})
+          for k, (scenario, g, (V, policy)) in enumerate(zip(scenarios, grid_worlds, results))]
+
+
+class BatchRunner:
+  """
+  Streams (scenario_id, V, policy, stats) tuples as scenarios finish.
+  Small value-iteration scenarios that share a shape (and use the default Jacobi
+  mode with the numpy backend) are stacked into one batched_value_iteration job,
+  each keeping its own gamma and theta; their stats have the keys of
+  value_iteration's plus "batched", the number of scenarios in the stack.
+  At most max_pending jobs are in the pool at once, so with max_pending <=
+  max_workers a job's timeout counts its run time, not time spent queued. A failed,
+  timed-out or cancelled scenario is reported with V and policy set to None and
+  stats {"error": ...}. A timed-out job still runs to completion in its worker and
+  keeps its slot until then; only its result is dropped.
+  Attributes:
+    max_workers: Number of worker processes.
+    timeout: Default per-job timeout in seconds (None for no limit).
+    stack_max_cells: Largest grid (height * width) that is stacked.
+    stack_size: Maximum number of scenarios per stacked job.
+    max_pending: Maximum number of jobs submitted to the pool at once (defaults to max_workers).
+  """
+  def __init__(self,
+               max_workers: int=None,
+               timeout: float=None,
+               stack_max_cells: int=2500,
+               stack_size: int=64,
+               max_pending: int=None):
+    self.max_workers = max_workers or os.cpu_count()
+    self.timeout = timeout
+    self.stack_max_cells = stack_max_cells
+    self.stack_size = stack_size
+    self.max_pending = max_pending or self.max_workers
+    self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+    self._tasks = []
+
+  def _plan(self, scenarios: list) -> list:
+    """Returns the jobs as (function, payload, scenario ids, timeout) tuples."""
+    jobs, stacks = [], {}
+    for scenario in scenarios:
+      grid_world = scenario.get("grid_world")
+      size = (grid_world.height, grid_world.width) if grid_world is not None else tuple(scenario.get("size", (3, 4)))
+      params = scenario.get("params", {})
+      stackable = (scenario.get("solver", "value_iteration") == "value_iteration"
+                   and size[0] * size[1] <= self.stack_max_cells
+                   and set(params) <= {"gamma", "theta", "backend"}
+                   and params.get("backend", "numpy") == "numpy")
+      if stackable:
+        key = (size, scenario.get("timeout", self.timeout))
+        stacks.setdefault(key, []).append(scenario)
+      else:
+        jobs.append((_solve_one, scenario, [scenario["id"]], scenario.get("timeout", self.timeout)))
+    for key, group in stacks.items():
+      for start in range(0, len(group), self.stack_size):
+        chunk = group[start:start + self.stack_size]
+        jobs.append((_solve_stack, chunk, [s["id"] for s in chunk], key[1]))
+    return jobs
+
+  async def run(self, scenarios: list):
+    """
+    Solves the scenarios, yielding (scenario_id, V, policy, stats) in completion order.
+    Leaving the loop early (or calling cancel()) cancels the jobs not yet finished.
+    """
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue()
+    pending = asyncio.Semaphore(self.max_pending)
+
+    async def dispatch(function, payload, ids, timeout):
+      future = None
+      try:
+        await pending.acquire()
+        try:
+          future = loop.run_in_executor(self._pool, function, payload)
+        except BaseException:
+          pending.release()
+          raise
+        #wait_for cannot stop a running worker, so the slot is freed when the job really ends.
+        future.add_done_callback(lambda _: pending.release())
+        solved = await asyncio.wait_for(asyncio.shield(future), timeout)
+      except asyncio.TimeoutError:
+        solved = [(i, None, None, {"error": "timeout"}) for i in ids]
+      except asyncio.CancelledError:
+        if future is not None:
+          future.cancel() #Drops the job if it has not started yet.
+        solved = [(i, None, None, {"error": "cancelled"}) for i in ids]
+      except Exception as e:
+        solved = [(i, None, None, {"error": repr(e)}) for i in ids]
+      for result in solved:
+        results.put_nowait(result)
+
+    self._tasks = [asyncio.create_task(dispatch(*job)) for job in self._plan(scenarios)]
+    outstanding = len(self._tasks)
+
+    def finished(task):
+      nonlocal outstanding
+      outstanding -= 1
+      if outstanding == 0:
+        results.put_nowait(None) #Also ends the stream if tasks were cancelled before starting.
+
+    for task in self._tasks:
+      task.add_done_callback(finished)
+    if not self._tasks:
+      return
+    try:
+      while (result := await results.get()) is not None:
+        yield result
+    finally:
+      self.cancel()
+
+  def cancel(self):
+    """Cancels every job of the current run that has not finished yet."""
+    for task in self._tasks:
+      task.cancel()
+
+  def close(self):
+    self.cancel()
+    self._pool.shutdown(wait=False, cancel_futures=True)
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc):
+    self.close()
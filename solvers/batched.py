@@ -0,0 +1,123 @@
+import copy
+import numpy as np
+from solvers.utils import greedy_policy
+
+
+def stack_models(grid_worlds: list) -> dict:
+  """
+  Concatenates the compiled models of same-shape grids into one flat problem.
+  State s of scenario k becomes k * S + s, so one gather over the stacked value
+  vector (a [K, H, W] tensor, flattened) backs up every scenario at once.
+  Returns:
+    Dict with the stacked "idx" [K*S, A, O], "prob", "R", "terminal_values" [K*S]
+    and "active" mask [K*S].
+  """
+  shapes = {(g.height, g.width) for g in grid_worlds}
+  if len(shapes) != 1:
+    raise ValueError(f"All grids must have the same shape, got {sorted(shapes)}")
+  models = [g.model for g in grid_worlds]
+  num_states = models[0].num_states
+  offsets = (np.arange(len(models), dtype=np.int64) * num_states)[:, None, None, None]
+  return {"idx": (np.stack([m.next_idx for m in models]) + offsets).reshape(-1, *models[0].next_idx.shape[1:]),
+          "prob": np.concatenate([m.next_prob for m in models]),
+          "R": np.concatenate([m.R for m in models]),
+          "terminal_values": np.concatenate([np.where(m.terminal_mask, m.rewards, 0.0) for m in models]),
+          "active": np.concatenate([m.active_mask for m in models]),
+          }
+
+
+def batched_value_iteration(grid_worlds: list,
+                            gamma=0.9,
+                            theta=1e-10,
+                            max_iter: int=1000,
+                            return_stats: bool=False):
+  """
+  Jacobi value iteration of K same-shape GridWorlds in one stacked array sweep.
+  Each scenario has its own gamma and stopping test. Once a scenario's largest
+  change drops below its theta its states are dropped from the sweep, so it gets
+  exactly the result of value_iteration(backend="numpy") run on its own and
+  finished scenarios stop costing compute. Rewards, step_cost and slip_prob come
+  from each grid's compiled model.
+  Args:
+    grid_worlds: List of K GridWorld instances of the same height and width.
+    gamma: Discount factor, a scalar or one per scenario.
+    theta: Minimum threshold to stop, a scalar or one per scenario.
+    max_iter: Maximum number of sweeps.
+    return_stats: If True, also return a dict with per-scenario iterations and
+      residuals and the total number of sweeps and backups.
+  Returns:
+    List of K (V, policy) tuples, followed by the stats dict if return_stats is set.
+  """
+  K = len(grid_worlds)
+  gammas = np.broadcast_to(np.asarray(gamma, dtype=float), (K,))
+  thetas = np.broadcast_to(np.asarray(theta, dtype=float), (K,))
+  stacked = stack_models(grid_worlds)
+  num_states = stacked["active"].size // max(K, 1)
+  states = np.flatnonzero(stacked["active"])
+  scenario = states // num_states
+  idx, prob, R = stacked["idx"][states], stacked["prob"][states], stacked["R"][states]
+  discount = gammas[scenario][:, None]
+  V = stacked["terminal_values"].copy()
+  iterations = np.zeros(K, dtype=np.int64)
+  residuals = np.zeros(K)
+  running = np.zeros(K, dtype=bool)
+  running[scenario] = True #Scenarios without active states are solved already.
+  sweeps = backups = 0
+  for iter in range(max_iter):
+    if not running.any():
+      break
+    V_new = np.max(R + discount * np.einsum("sak,sak->sa", prob, V[idx]), axis=1)
+    diff = np.abs(V[states] - V_new)
+    V[states] = V_new
+    # states are grouped by scenario, so each running scenario is one contiguous run.
+    starts = np.flatnonzero(np.r_[True, scenario[1:] != scenario[:-1]])
+    ids = scenario[starts]
+    residuals[ids] = np.maximum.reduceat(diff, starts)
+    iterations[ids] += 1
+    sweeps += 1
+    backups += states.size
+    done = running & (residuals < thetas)
+    if done.any():
+      running &= ~done
+      keep = running[scenario]
+      states, scenario, idx, prob, R, discount = (a[keep] for a in (states, scenario, idx, prob, R, discount))
+  results = []
+  for k, (grid_world, V_k) in enumerate(zip(grid_worlds, V.reshape(K, -1))):
+    V_k = V_k.reshape(grid_world.height, grid_world.width)
+    results.append((V_k, greedy_policy(grid_world.model, V_k, gammas[k])))
+  if return_stats:
+    return results, {"iterations": iterations.tolist(), "residuals": residuals.tolist(),
+                     "sweeps": sweeps, "backups": backups}
+  return results
+
+
+def parameter_sweep(grid_world,
+                    gamma=0.9,
+                    step_cost=None,
+                    slip_prob=None,
+                    rewards: list=None,
+                    theta=1e-10,
+                    max_iter: int=1000,
+                    return_stats: bool=False):
+  """
+  Solves variants of one GridWorld in a single batched_value_iteration call.
+  gamma, step_cost and slip_prob are scalars or sequences of length K (None keeps
+  the grid's own value); rewards is an optional list of K reward arrays.
+  Returns:
+    List of K (V, policy) tuples, as batched_value_iteration.
+  """
+  vectors = {"step_cost": step_cost, "slip_prob": slip_prob, "rewards": rewards}
+  lengths = {len(v) for v in (gamma, step_cost, slip_prob, rewards) if v is not None and np.ndim(v) > 0}
+  if len(lengths) > 1:
+    raise ValueError(f"Parameter sequences have different lengths: {sorted(lengths)}")
+  K = lengths.pop() if lengths else 1
+  variants = []
+  for k in range(K):
+    #Shallow copy: the layout fields (walls, terminal, read-only rewards) are immutable, so
+    #sharing them is safe, and each setter below resets _model so the variant compiles its own.
+    variant = copy.copy(grid_world)
+    for name, values in vectors.items():
+      if values is not None:
+        setattr(variant, name, values[k] if name == "rewards" or np.ndim(values) > 0 else values)
+    variants.append(variant)
+  return batched_value_iteration(variants, gamma, theta, max_iter, return_stats)
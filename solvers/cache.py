@@ -0,0 +1,210 @@
+import glob
+import hashlib
+import inspect
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+
+
+def _digest(*parts) -> str:
+  h = hashlib.sha256()
+  for part in parts:
+    h.update(part if isinstance(part, bytes) else repr(part).encode())
+  return h.hexdigest()
+
+
+def layout_key(grid_world) -> str:
+  """
+  Stable hash of the grid layout only (size, walls and terminal states).
+  Solutions with the same layout are valid warm starts for one another.
+  """
+  model = grid_world.model
+  return _digest(model.height, model.width, np.packbits(model.wall_mask).tobytes(),
+                 np.packbits(model.terminal_mask).tobytes())
+
+
+def environment_key(grid_world) -> str:
+  """
+  Stable hash of the full environment definition: the layout plus rewards,
+  step_cost, slip_prob and value_dtype (a float32 solve differs from a float64 one).
+  """
+  model = grid_world.model
+  return _digest(layout_key(grid_world), np.ascontiguousarray(model.rewards, dtype=np.float64).tobytes(),
+                 float(grid_world.step_cost), float(grid_world.slip_prob), grid_world.value_dtype.str)
+
+
+def solve_key(grid_world,
+              solver: str,
+              params: dict) -> str:
+  """
+  Cache key of solver run with params (keyword arguments) on grid_world.
+  """
+  return _digest(environment_key(grid_world), solver, json.dumps(params, sort_keys=True, default=repr))
+
+
+class SolveCache:
+  """
+  Content-addressed cache of (V, policy) solutions.
+  Entries live in an in-memory LRU tier and, if a directory is given, in an
+  on-disk tier of uncompressed .npz files evicted oldest-used first once their
+  total size exceeds max_bytes. Disk files are named <layout>-<key>.npz so the
+  most recent solution of a layout can be found for warm starts. The directory is
+  scanned once when the cache is opened; after that lookups go through an
+  in-memory index of key -> path, so files written by another process in the
+  meantime are only seen by caches opened later.
+  Cached arrays are read-only; copy them before modifying.
+  Attributes:
+    max_entries: Capacity of the in-memory tier.
+    directory: Directory of the on-disk tier, or None.
+    max_bytes: Size bound of the on-disk tier.
+    hits, disk_hits, misses: Lookup counters.
+  """
+  # Parameters that do not change the solution and are left out of the key.
+  IGNORED_PARAMS = ("monitor", "return_stats", "V_init")
+
+  def __init__(self,
+               max_entries: int=128,
+               directory: str=None,
+               max_bytes: int=1 << 30):
+    self.max_entries = max_entries
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self._memory = OrderedDict() #key -> (V, policy, layout)
+    self._layouts = {} #layout -> most recently stored key
+    self._disk = {} #key -> path of its file in directory
+    self.hits = self.disk_hits = self.misses = 0
+    if directory is not None:
+      os.makedirs(directory, exist_ok=True)
+      for path in glob.glob(os.path.join(directory, "*-*.npz")):
+        self._disk[os.path.basename(path)[:-4].split("-")[1]] = path
+
+  def __len__(self) -> int:
+    return len(self._memory)
+
+  def __contains__(self, key: str) -> bool:
+    return key in self._memory or self._disk_path(key) is not None
+
+  def _disk_path(self, key: str) -> str:
+    return self._disk.get(key)
+
+  def _remember(self, key: str, V: np.array, policy: np.array, layout: str):
+    V.flags.writeable = policy.flags.writeable = False
+    self._memory[key] = (V, policy, layout)
+    self._memory.move_to_end(key)
+    self._layouts[layout] = key
+    while len(self._memory) > self.max_entries:
+      self._memory.popitem(last=False)
+
+  def get(self, key: str) -> tuple:
+    """
+    Returns the cached (V, policy) for key, or None.
+    """
+    entry = self._memory.get(key)
+    if entry is not None:
+      self._memory.move_to_end(key)
+      self.hits += 1
+      return entry[:2]
+    path = self._disk_path(key)
+    if path is not None:
+      try:
+        with np.load(path) as data:
+          V, policy = data["V"], data["policy"]
+        os.utime(path) #Marks the file as recently used for eviction.
+      except FileNotFoundError: #Removed by another process since it was indexed.
+        del self._disk[key]
+        path = None
+    if path is None:
+      self.misses += 1
+      return None
+    self._remember(key, V, policy, os.path.basename(path).split("-")[0])
+    self.disk_hits += 1
+    return V, policy
+
+  def put(self,
+          key: str,
+          V: np.array,
+          policy: np.array,
+          layout: str):
+    """
+    Stores a solution under key; layout is the layout_key of its grid.
+    """
+    V, policy = np.array(V), np.array(policy)
+    self._remember(key, V, policy, layout)
+    if self.directory is None:
+      return
+    path = os.path.join(self.directory, f"{layout}-{key}.npz")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+      np.savez(f, V=V, policy=policy)
+    os.replace(tmp, path) #Readers never see a partial file.
+    self._disk[key] = path
+    self._evict_disk()
+
+  def _evict_disk(self):
+    entries = []
+    for key, path in list(self._disk.items()):
+      try:
+        stat = os.stat(path)
+      except FileNotFoundError:
+        del self._disk[key]
+        continue
+      entries.append((stat.st_mtime, stat.st_size, key, path))
+    total = sum(size for _, size, _, _ in entries)
+    for _, size, key, path in sorted(entries):
+      if total <= self.max_bytes:
+        break
+      os.remove(path)
+      del self._disk[key]
+      total -= size
+
+  def warm_start(self, grid_world) -> np.array:
+    """
+    Returns the most recently stored V of a grid with the same layout (e.g. the
+    same maze solved with another gamma or other rewards), or None.
+    """
+    layout = layout_key(grid_world)
+    key = self._layouts.get(layout)
+    if key in self._memory:
+      return self._memory[key][0]
+    if self.directory is None:
+      return None
+    prefix = os.path.join(self.directory, f"{layout}-")
+    paths = [path for path in self._disk.values() if path.startswith(prefix)]
+    if not paths:
+      return None
+    with np.load(max(paths, key=os.path.getmtime)) as data:
+      return data["V"]
+
+  def solve(self,
+            solver,
+            grid_world,
+            **params) -> tuple:
+    """
+    Returns solver(grid_world, **params)[:2] from the cache, running the solver on a miss.
+    On a miss, solvers accepting V_init are warm-started from warm_start(grid_world)
+    unless params already set it.
+    Args:
+      solver: Solver function returning (V, policy, ...), e.g. value_iteration.
+      grid_world: Instance of GridWorld class.
+      params: Keyword arguments of the solver; they are part of the key.
+    Returns:
+      Tuple (V, policy) of read-only arrays.
+    """
+    key_params = {name: value for name, value in params.items() if name not in self.IGNORED_PARAMS}
+    key = solve_key(grid_world, f"{solver.__module__}.{solver.__name__}", key_params)
+    cached = self.get(key)
+    if cached is not None:
+      return cached
+    if "V_init" not in params and "V_init" in inspect.signature(solver).parameters:
+      V_init = self.warm_start(grid_world)
+      if V_init is not None:
+        params["V_init"] = V_init
+    V, policy = solver(grid_world, **params)[:2]
+    self.put(key, V, policy, layout_key(grid_world))
+    return self._memory[key][:2]
+
+  def clear(self):
+    """Empties the in-memory tier (the on-disk files are kept)."""
+    self._memory.clear()
+    self._layouts.clear()
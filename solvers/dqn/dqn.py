@@ -1,15 +1,160 @@
+import copy
 import numpy as np
 import torch
 import torch.nn as nn
 from torch.optim import Adam
-from torch.utils.data import Dataset, DataLoader
+from grid_world.vec_env import VecGridWorld
+from solvers.dqn.replay_buffer import ReplayBuffer
+from solvers.instrumentation import NULL_MONITOR
 
 
 class Network(nn.Module):
-  def __init__(self):
+  """
+  Small MLP mapping encoded states to one Q value per action.
+  """
+  def __init__(self,
+               in_features: int,
+               num_actions: int=4,
+               hidden: tuple=(64, 64)):
     super().__init__()
+    layers, width = [], in_features
+    for size in hidden:
+      layers += [nn.Linear(width, size), nn.ReLU()]
+      width = size
+    layers.append(nn.Linear(width, num_actions))
+    self.layers = nn.Sequential(*layers)
 
   def forward(self, x):
-    return x
+    return self.layers(x)
 
 
+def encode_states(grid_world,
+                  encoder: str="onehot") -> torch.Tensor:
+  """
+  Precomputes the network input of every flat state index.
+  Args:
+    grid_world: Instance of GridWorld class.
+    encoder: "onehot" (one unit per cell) or "coords" (normalized row/column
+      plus sine/cosine features, for grids too large for one-hot inputs).
+  Returns:
+    float32 tensor [S, F]; row s is the encoding of state s.
+  """
+  num_states = grid_world.height * grid_world.width
+  if encoder == "onehot":
+    return torch.eye(num_states)
+  if encoder == "coords":
+    rows, cols = np.divmod(np.arange(num_states), grid_world.width)
+    y, x = rows / max(grid_world.height - 1, 1), cols / max(grid_world.width - 1, 1)
+    freqs = np.pi * np.arange(1, 5)[:, None]
+    features = np.concatenate([[y, x], np.sin(freqs * y), np.cos(freqs * y), np.sin(freqs * x), np.cos(freqs * x)])
+    return torch.from_numpy(features.T.astype(np.float32))
+  raise ValueError(f"Unknown encoder: {encoder}")
+
+
+def dqn(grid_world,
+        gamma: float=0.9,
+        num_steps: int=40000,
+        num_envs: int=32,
+        batch_size: int=128,
+        buffer_size: int=100000,
+        lr: float=5e-4,
+        hidden: tuple=(128, 128),
+        encoder: str="onehot",
+        epsilon_start: float=1.0,
+        epsilon_end: float=0.05,
+        exploration_steps: int=10000,
+        episode_length: int=200,
+        warmup: int=1000,
+        updates_per_step: int=1,
+        target_update: int=100,
+        tau: float=None,
+        num_threads: int=None,
+        seed: int=None,
+        monitor=None):
+  """
+  Deep Q Learning on a GridWorld, tuned for CPU-only machines.
+  num_envs agents act together through VecGridWorld with one batched forward
+  pass under torch.inference_mode, and transitions go through a ReplayBuffer.
+  Targets bootstrap terminal states from their reward, as value_iteration does,
+  so the returned V is directly comparable with it. The defaults reach the
+  value-iteration policy on a 20x20 map (max regret about 0.01, in about two and a
+  half minutes on one thread; see the "dqn" benchmark); smaller maps converge with
+  fewer num_steps.
+  Args:
+    grid_world: Instance of GridWorld class.
+    gamma: Discount factor.
+    num_steps: Number of batched environment steps.
+    num_envs: Number of agents stepped together.
+    batch_size: Replay batch size.
+    buffer_size: Replay buffer capacity.
+    lr: Adam learning rate.
+    hidden: Hidden layer sizes of the MLP.
+    encoder: State encoding, see encode_states.
+    epsilon_start: Initial exploration rate.
+    epsilon_end: Final exploration rate.
+    exploration_steps: Steps over which epsilon decays linearly.
+    episode_length: Steps after which an agent is reset.
+    warmup: Transitions collected before training starts.
+    updates_per_step: Gradient steps per environment step.
+    target_update: Steps between hard target-network syncs (ignored if tau is set).
+    tau: If set, soft (Polyak) target update rate applied every step.
+    num_threads: If set, passed to torch.set_num_threads.
+    seed: Seed for torch, the environments and the replay sampling.
+    monitor: Optional solvers.instrumentation.Monitor; gets the loss of every
+      training step (and may stop training) and the "rollout" / "update" phase times.
+  Returns:
+    Tuple (V, policy): values [H, W] and int8 policy [H, W] (-1 on walls and
+    terminal states), as accepted by show_values and show_policy.
+  """
+  if num_threads is not None:
+    torch.set_num_threads(num_threads)
+  if seed is not None:
+    torch.manual_seed(seed)
+  model = grid_world.model
+  features = encode_states(grid_world, encoder)
+  online = Network(features.shape[1], model.num_actions, hidden)
+  target = copy.deepcopy(online)
+  optimizer = Adam(online.parameters(), lr=lr)
+  buffer = ReplayBuffer(buffer_size, batch_size, seed=seed)
+  env = VecGridWorld(grid_world, num_envs, max_steps=episode_length, seed=seed)
+  terminal_values = torch.from_numpy(np.where(model.terminal_mask, model.rewards, 0.0).astype(np.float32))
+
+  monitor = NULL_MONITOR if monitor is None else monitor
+
+  for step in range(num_steps):
+    epsilon = max(epsilon_end, epsilon_start - (epsilon_start - epsilon_end) * step / exploration_steps)
+    with monitor.phase("rollout"):
+      states = env.states.copy()
+      with torch.inference_mode():
+        actions = online(features[torch.from_numpy(states)]).argmax(dim=1).numpy()
+      explore = env.rng.random(num_envs) < epsilon
+      actions[explore] = env.rng.integers(model.num_actions, size=np.count_nonzero(explore))
+      new_states, _, _ = env.step(actions)
+      buffer.add(states, actions, model.R[states, actions], new_states, model.terminal_mask[new_states])
+
+    if len(buffer) >= warmup:
+      with monitor.phase("update"):
+        for _ in range(updates_per_step):
+          s, a, r, s_next, done = buffer.sample()
+          q = online(features[s]).gather(1, a.unsqueeze(1)).squeeze(1)
+          with torch.no_grad():
+            next_v = target(features[s_next]).max(dim=1).values
+            y = r + gamma * torch.where(done > 0, terminal_values[s_next], next_v)
+          loss = nn.functional.smooth_l1_loss(q, y)
+          optimizer.zero_grad(set_to_none=True)
+          loss.backward()
+          optimizer.step()
+        if tau is not None:
+          with torch.no_grad():
+            for p_target, p_online in zip(target.parameters(), online.parameters()):
+              p_target.lerp_(p_online, tau)
+        elif step % target_update == 0:
+          target.load_state_dict(online.state_dict())
+      if monitor.enabled and monitor.on_iteration("dqn", step, loss.item()):
+        break
+
+  with torch.inference_mode():
+    Q = online(features).numpy().astype(float)
+  V = np.where(model.terminal_mask, model.rewards, np.where(model.active_mask, Q.max(axis=1), 0.0))
+  policy = np.where(model.active_mask, Q.argmax(axis=1), -1).astype(np.int8)
+  return V.reshape(grid_world.height, grid_world.width), policy.reshape(grid_world.height, grid_world.width)
@@ -0,0 +1,299 @@
+import json
+import os
+import numpy as np
+import torch
+
+
+class ReplayBuffer:
+  """
+  Fixed-capacity ring buffer of (s, a, r, s', done) transitions.
+  All storage is preallocated as contiguous numpy arrays (optionally memory-mapped
+  files, so a run can be resumed with ReplayBuffer.load). Sampling gathers into
+  preallocated batch arrays that back torch tensors created once with
+  torch.from_numpy, so a steady-state add/sample cycle allocates nothing.
+  The returned tensors are views: they are overwritten by the next sample.
+  Attributes:
+    capacity: Maximum number of transitions kept.
+    batch_size: Number of transitions per sample.
+    size: Number of transitions currently stored.
+    position: Slot the next transition is written to.
+    path: Directory of the memory-mapped storage, or None.
+  """
+  _FIELDS = ("states", "actions", "rewards", "next_states", "dones")
+
+  def __init__(self,
+               capacity: int,
+               batch_size: int=64,
+               state_shape: tuple=(),
+               state_dtype=np.int64,
+               seed: int=None,
+               path: str=None):
+    """
+    Initializes an empty buffer.
+    Args:
+      capacity: Maximum number of transitions kept.
+      batch_size: Number of transitions per sample.
+      state_shape: Shape of one state; () for flat GridWorld state indices.
+      state_dtype: dtype of the stored states.
+      seed: Seed for the sampling generator.
+      path: Optional directory; storage is then memory-mapped from files there.
+    """
+    self.capacity = capacity
+    self.batch_size = batch_size
+    self.state_shape = tuple(state_shape)
+    self.state_dtype = np.dtype(state_dtype)
+    self.size = 0
+    self.position = 0
+    self.path = path
+    self.rng = np.random.default_rng(seed)
+    self._storage = self._allocate("w+")
+    self._init_batch()
+
+  def _layouts(self) -> dict:
+    return {"states": ((self.capacity,) + self.state_shape, self.state_dtype),
+            "actions": ((self.capacity,), np.dtype(np.int64)),
+            "rewards": ((self.capacity,), np.dtype(np.float32)),
+            "next_states": ((self.capacity,) + self.state_shape, self.state_dtype),
+            "dones": ((self.capacity,), np.dtype(np.float32))
+            }
+
+  def _allocate(self, mode: str) -> dict:
+    storage = {}
+    for name, (shape, dtype) in self._layouts().items():
+      if self.path is None:
+        storage[name] = np.zeros(shape, dtype=dtype)
+      else:
+        os.makedirs(self.path, exist_ok=True)
+        filename = os.path.join(self.path, f"{name}.npy")
+        if mode == "w+":
+          storage[name] = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=shape)
+        else:
+          storage[name] = np.load(filename, mmap_mode=mode)
+    return storage
+
+  def _init_batch(self):
+    self._uniform = np.empty(self.batch_size)
+    self._indices = np.empty(self.batch_size, dtype=np.int64)
+    self._batch = {name: np.empty((self.batch_size,) + self._storage[name].shape[1:], dtype=self._storage[name].dtype)
+                   for name in self._FIELDS}
+    self._tensors = tuple(torch.from_numpy(self._batch[name]) for name in self._FIELDS)
+
+  def __len__(self) -> int:
+    return self.size
+
+  def add(self,
+          states,
+          actions,
+          rewards,
+          next_states,
+          dones) -> np.array:
+    """
+    Appends a batch of transitions (arrays with a leading batch dimension),
+    overwriting the oldest ones once the buffer is full.
+    Returns:
+      Int array of the slots written.
+    """
+    n = len(actions)
+    slots = (self.position + np.arange(n)) % self.capacity
+    for name, values in zip(self._FIELDS, (states, actions, rewards, next_states, dones)):
+      self._storage[name][slots] = values
+    self.position = (self.position + n) % self.capacity
+    self.size = min(self.size + n, self.capacity)
+    return slots
+
+  def _gather(self) -> tuple:
+    for name in self._FIELDS:
+      np.take(self._storage[name], self._indices, axis=0, out=self._batch[name])
+    return self._tensors
+
+  def sample(self) -> tuple:
+    """
+    Draws batch_size transitions uniformly (with replacement).
+    Returns:
+      Tuple of torch tensors (states, actions, rewards, next_states, dones), which
+      are reused by the next call.
+    """
+    if self.size == 0:
+      raise ValueError("cannot sample from an empty buffer")
+    self.rng.random(out=self._uniform)
+    self._uniform *= self.size
+    self._indices[:] = self._uniform
+    return self._gather()
+
+  def _meta(self) -> dict:
+    return {"capacity": self.capacity, "batch_size": self.batch_size, "state_shape": list(self.state_shape),
+            "state_dtype": self.state_dtype.str, "size": self.size, "position": self.position}
+
+  def _restore(self, meta: dict):
+    self.capacity, self.batch_size = meta["capacity"], meta["batch_size"]
+    self.state_shape, self.state_dtype = tuple(meta["state_shape"]), np.dtype(meta["state_dtype"])
+    self.size, self.position = meta["size"], meta["position"]
+
+  def flush(self):
+    """Writes the memory-mapped storage and the ring position to disk."""
+    if self.path is None:
+      raise ValueError("flush() needs a buffer created with a path")
+    for array in self._storage.values():
+      array.flush()
+    with open(os.path.join(self.path, "meta.json"), "w") as f:
+      json.dump(self._meta(), f)
+
+  @classmethod
+  def load(cls,
+           path: str,
+           seed: int=None):
+    """
+    Reopens a buffer saved with flush(); the storage stays memory-mapped.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+      meta = json.load(f)
+    buffer = cls.__new__(cls)
+    buffer._restore(meta)
+    buffer.path = path
+    buffer.rng = np.random.default_rng(seed)
+    buffer._storage = buffer._allocate("r+")
+    buffer._init_batch()
+    return buffer
+
+
+class SumTree:
+  """
+  Binary sum tree over `capacity` priorities stored in one flat array.
+  Leaves live at tree[leaves + i] and every parent holds the sum of its children,
+  so batched updates and prefix-sum searches take O(log n) vectorized steps.
+  Attributes:
+    capacity: Number of leaves in use.
+    tree: Flat array of node sums; tree[1] is the total.
+  """
+  def __init__(self,
+               capacity: int,
+               tree: np.array=None):
+    self.capacity = capacity
+    self.depth = max(int(np.ceil(np.log2(capacity))), 0)
+    self.leaves = 1 << self.depth
+    self.tree = np.zeros(2 * self.leaves) if tree is None else tree
+    self._scratch = None #(left sums, go-right flags) reused by find.
+
+  @property
+  def total(self) -> float:
+    return float(self.tree[1])
+
+  def update(self,
+             indices: np.array,
+             priorities: np.array):
+    nodes = np.asarray(indices, dtype=np.int64) + self.leaves
+    self.tree[nodes] = priorities
+    for _ in range(self.depth):
+      nodes = np.unique(nodes // 2)
+      self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+  def find(self,
+           values: np.array,
+           out: np.array=None) -> np.array:
+    """
+    Returns the leaf index of each value's position in the cumulative priorities.
+    With out (an int64 array of the same length), the indices are written there and
+    values (a float array) is used as scratch and overwritten, so repeated calls
+    with the same batch size allocate nothing.
+    """
+    if out is None:
+      values = np.array(values, dtype=float)
+      out = np.empty(len(values), dtype=np.int64)
+    if self._scratch is None or len(self._scratch[0]) != len(values):
+      self._scratch = (np.empty(len(values)), np.empty(len(values), dtype=bool))
+    left, right = self._scratch
+    nodes = out
+    nodes.fill(1)
+    for _ in range(self.depth):
+      nodes *= 2
+      np.take(self.tree, nodes, out=left)
+      np.greater(values, left, out=right)
+      left *= right #Mass of the left subtree where the search goes right, 0 elsewhere.
+      values -= left
+      nodes += right
+    nodes -= self.leaves
+    return np.minimum(nodes, self.capacity - 1, out=nodes)
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+  """
+  Replay buffer with proportional prioritized sampling backed by a SumTree.
+  New transitions get the current maximum priority. sample() returns the slots
+  drawn and their normalized importance-sampling weights; feed the new TD errors
+  back with update_priorities. Like the uniform sample(), it works in preallocated
+  scratch arrays, so steady-state sampling allocates nothing.
+  Attributes:
+    alpha: Priority exponent (0 is uniform sampling).
+    beta: Importance-sampling exponent.
+    eps: Constant added to |TD error| so no transition starves.
+  """
+  def __init__(self,
+               capacity: int,
+               batch_size: int=64,
+               state_shape: tuple=(),
+               state_dtype=np.int64,
+               alpha: float=0.6,
+               beta: float=0.4,
+               eps: float=1e-3,
+               seed: int=None,
+               path: str=None):
+    self.alpha, self.beta, self.eps = alpha, beta, eps
+    self.max_priority = 1.0
+    super().__init__(capacity, batch_size, state_shape, state_dtype, seed, path)
+
+  def _layouts(self) -> dict:
+    layouts = super()._layouts()
+    leaves = 1 << max(int(np.ceil(np.log2(self.capacity))), 0)
+    layouts["priorities"] = ((2 * leaves,), np.dtype(np.float64))
+    return layouts
+
+  def _init_batch(self):
+    super()._init_batch()
+    self.tree = SumTree(self.capacity, self._storage["priorities"])
+    self._offsets = np.arange(self.batch_size)
+    self._nodes = np.empty(self.batch_size, dtype=np.int64)
+    self._probs = np.empty(self.batch_size)
+    self._weights_array = np.empty(self.batch_size, dtype=np.float32)
+    self._weights = torch.from_numpy(self._weights_array)
+
+  def add(self, states, actions, rewards, next_states, dones) -> np.array:
+    slots = super().add(states, actions, rewards, next_states, dones)
+    self.tree.update(slots, np.full(len(slots), self.max_priority ** self.alpha))
+    return slots
+
+  def sample(self) -> tuple:
+    """
+    Draws batch_size transitions with probability proportional to priority ** alpha,
+    one from each of batch_size equal slices of the total mass.
+    Returns:
+      Tuple of (states, actions, rewards, next_states, dones, weights, slots).
+    """
+    if self.size == 0:
+      raise ValueError("cannot sample from an empty buffer")
+    self.rng.random(out=self._uniform)
+    self._uniform += self._offsets
+    self._uniform *= self.tree.total / self.batch_size
+    self.tree.find(self._uniform, out=self._indices)
+    np.add(self._indices, self.tree.leaves, out=self._nodes)
+    np.take(self.tree.tree, self._nodes, out=self._probs)
+    self._probs *= self.size / self.tree.total #size * P(slot).
+    np.power(self._probs, -self.beta, out=self._probs)
+    np.divide(self._probs, self._probs.max(), out=self._weights_array)
+    return self._gather() + (self._weights, self._indices)
+
+  def update_priorities(self,
+                        slots: np.array,
+                        td_errors: np.array):
+    priorities = np.abs(np.asarray(td_errors, dtype=float)) + self.eps
+    self.max_priority = max(self.max_priority, float(priorities.max()))
+    self.tree.update(slots, priorities ** self.alpha)
+
+  def _meta(self) -> dict:
+    meta = super()._meta()
+    meta.update(alpha=self.alpha, beta=self.beta, eps=self.eps, max_priority=self.max_priority)
+    return meta
+
+  def _restore(self, meta: dict):
+    super()._restore(meta)
+    self.alpha, self.beta, self.eps = meta["alpha"], meta["beta"], meta["eps"]
+    self.max_priority = meta["max_priority"]
@@ -0,0 +1,127 @@
+import logging
+import numpy as np
+from solvers.instrumentation import NULL_MONITOR
+from solvers.utils import bellman_q
+from solvers.value_iteration import prioritized_sweeping
+
+logger = logging.getLogger(__name__)
+
+
+def resolve(grid_world,
+            V: np.array,
+            policy: np.array,
+            walls: dict=None,
+            terminal: dict=None,
+            rewards: dict=None,
+            gamma: float=0.9,
+            theta: float=1e-10,
+            mode: str="prioritized",
+            return_stats: bool=False,
+            monitor=None):
+  """
+  Updates a value iteration solution after a few cells of the grid changed.
+  The changes are applied with GridWorld.apply_changes, which patches the compiled
+  model in place. Backups start from the rebuilt states (the edited cells and their
+  neighbours, which include all their predecessors) and spread to a predecessor only
+  while its Bellman error bound, raised by gamma times each change of a successor,
+  exceeds theta. The greedy action is recomputed only for the rebuilt states and the
+  predecessors of states whose value changed, so the work follows the size of the
+  affected region, not of the grid.
+  Parameters:
+    grid_world: an instance of the GridWorld class, modified in place.
+    V: values [H, W] solved for the grid before the changes (with the same gamma).
+    policy: int policy [H, W] matching V, as returned with backend="numpy".
+    walls: dict (row, col) -> bool, True to add a wall and False to remove one.
+    terminal: dict (row, col) -> bool, True to make the cell terminal.
+    rewards: dict (row, col) -> new reward of the cell.
+    gamma: discount factor for the returns.
+    theta: states whose Bellman error bound is at most theta are left alone.
+    mode: "prioritized" pops one state at a time from a priority queue (fewest
+      backups, best for local edits); "frontier" backs up every pending state at
+      once in array sweeps, which is faster once an edit reaches a large part of the
+      map (e.g. a changed terminal reward).
+    return_stats: if True, also return a dict with the number of edited cells, seed
+      states, backups and policy updates.
+    monitor: optional solvers.instrumentation.Monitor; gets the "resolve" phase time,
+      the backup count and, as the residual, the largest pending error bound after
+      every round of backups (as many pops as there are active states in "prioritized"
+      mode, one sweep in "frontier" mode); a True return stops the backups early.
+  Returns:
+    Tuple (V, policy) of new arrays, followed by the stats dict if return_stats is set.
+  """
+  if mode not in ("prioritized", "frontier"):
+    raise ValueError(f"Unknown mode: {mode}")
+  monitor = NULL_MONITOR if monitor is None else monitor
+  model = grid_world.model
+  with monitor.phase("resolve"):
+    changed, rows = grid_world.apply_changes(walls, terminal, rewards)
+    V_old = np.ravel(V)
+    V = V_old.copy()
+    #Walls keep 0 and terminal states their reward, as in a fresh solve.
+    V[changed] = np.where(model.wall_mask[changed], 0.0,
+                          np.where(model.terminal_mask[changed], model.rewards[changed], V[changed]))
+    if mode == "prioritized":
+      backups = prioritized_sweeping(model, V, gamma, theta, seeds=rows, monitor=monitor, solver="resolve")
+    else:
+      backups = frontier_sweeping(model, V, gamma, theta, seeds=rows, monitor=monitor, solver="resolve")
+    moved = np.flatnonzero(V != V_old)
+    region = np.union1d(rows, model.predecessors_of(moved)) if moved.size else rows
+    policy = np.array(policy, dtype=int).ravel()
+    policy[region] = -1
+    states = region[model.active_mask[region]]
+    policy[states] = np.argmax(bellman_q(model, V, gamma, states), axis=1)
+  monitor.count("backups", backups)
+  logger.info("resolve: %d cells changed, %d backups", changed.size, backups)
+  shape = (grid_world.height, grid_world.width)
+  if return_stats:
+    return V.reshape(shape), policy.reshape(shape), {"changed_cells": int(changed.size), "seeds": int(rows.size),
+                                                     "backups": backups, "policy_updates": int(region.size)}
+  return V.reshape(shape), policy.reshape(shape)
+
+
+def frontier_sweeping(model,
+                      V: np.array,
+                      gamma: float=0.9,
+                      theta: float=1e-10,
+                      seeds: np.array=None,
+                      monitor=NULL_MONITOR,
+                      solver: str="frontier_sweeping") -> int:
+  """
+  Array counterpart of prioritized_sweeping: instead of popping the largest error
+  bound, every state whose bound exceeds theta is backed up in one synchronous
+  sweep, and the changes raise the bounds of their predecessors for the next one.
+  Parameters:
+    model: TransitionModel of the grid.
+    V: Flat array [S] of state values, modified in place.
+    gamma: discount factor for the returns.
+    theta: states whose error bound is at most theta are left alone.
+    seeds: state indices to back up first; defaults to every active state.
+    monitor: solvers.instrumentation.Monitor; gets the largest error bound left after
+      every sweep as the residual, and a True return stops the sweeping.
+    solver: name the reports are made under.
+  Returns:
+    Number of single-state backups performed.
+  """
+  pred_indptr, pred_indices = model.predecessors()
+  region = np.flatnonzero(model.active_mask) if seeds is None else np.asarray(seeds, dtype=np.int64)
+  region = region[model.active_mask[region]]
+  bound = np.zeros(model.num_states)
+  backups = 0
+  iteration = 0
+  while region.size:
+    V_new = np.max(bellman_q(model, V, gamma, region), axis=1)
+    delta = np.abs(V_new - V[region])
+    V[region] = V_new
+    bound[region] = 0.0
+    backups += region.size
+    moved, delta = region[delta > 0], delta[delta > 0]
+    starts = pred_indptr[moved]
+    counts = pred_indptr[moved + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    np.add.at(bound, pred_indices[offsets], gamma * np.repeat(delta, counts))
+    candidates = np.unique(pred_indices[offsets])
+    region = candidates[bound[candidates] > theta]
+    if monitor.on_iteration(solver, iteration, float(np.max(bound[region], initial=0.0))):
+      break
+    iteration += 1
+  return backups
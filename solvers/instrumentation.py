@@ -0,0 +1,193 @@
+"""
+Instrumentation hooks shared by the solvers.
+Every solver takes a `monitor` argument and reports through it:
+  monitor.on_iteration(solver, iteration, residual) after each sweep / pass; a True
+    return value asks the solver to stop early.
+  with monitor.phase("evaluation"): ... accumulates wall time per phase.
+  monitor.count(name, n) increments a named counter.
+  monitor.snapshot(solver, iteration, V, residual) hands over the current [H, W]
+    values; only consumers of them (e.g. solvers.snapshots.SnapshotStream) act on it.
+Environment steps are counted through GridWorld.monitor (see GridWorld.step).
+The default NULL_MONITOR does nothing, so an uninstrumented solve pays one no-op
+call per iteration.
+"""
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+
+class Monitor:
+  """
+  Collects counters, per-phase timings and the residual history of a solve.
+  Attributes:
+    enabled: False only for NullMonitor.
+    counters: Dict of counter name -> count.
+    timings: Dict of phase name -> accumulated seconds.
+    history: List of (solver, iteration, residual) tuples.
+    stop_when: Optional callable taking the residual list of the reporting solver
+      and returning True to stop it early (see residual_plateau). The list is kept
+      per solver and appended to, so it is not rebuilt from history every iteration.
+  """
+  enabled = True
+
+  def __init__(self, stop_when=None):
+    self.counters = defaultdict(int)
+    self.timings = defaultdict(float)
+    self.history = []
+    self.stop_when = stop_when
+    self._residuals = defaultdict(list) #solver -> residuals in order, for stop_when.
+
+  def on_iteration(self,
+                   solver: str,
+                   iteration: int,
+                   residual: float=None) -> bool:
+    """
+    Records one iteration of solver. Returns True if the solver should stop.
+    """
+    self.counters[f"{solver}.iterations"] += 1
+    self.history.append((solver, iteration, residual))
+    if residual is not None:
+      self._residuals[solver].append(residual)
+    return self.stop_when is not None and bool(self.stop_when(self._residuals[solver]))
+
+  def residuals(self, solver: str) -> list:
+    return list(self._residuals.get(solver, ()))
+
+  def count(self,
+            name: str,
+            n: int=1):
+    self.counters[name] += int(n)
+
+  def snapshot(self,
+               solver: str,
+               iteration: int,
+               V,
+               residual: float=None):
+    """Receives the values after an iteration; V may be modified by the solver afterwards."""
+    pass
+
+  @contextmanager
+  def phase(self, name: str):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.timings[name] += time.perf_counter() - start
+
+  def summary(self) -> dict:
+    return {"counters": dict(self.counters), "timings": dict(self.timings)}
+
+  def reset(self):
+    self.counters.clear()
+    self.timings.clear()
+    self.history.clear()
+    self._residuals.clear()
+
+
+class NullMonitor(Monitor):
+  """
+  Monitor that records nothing; the default of every solver.
+  """
+  enabled = False
+  _phase = nullcontext()
+
+  def __init__(self):
+    self.stop_when = None
+
+  def on_iteration(self, solver, iteration, residual=None) -> bool:
+    return False
+
+  def count(self, name, n=1):
+    pass
+
+  def phase(self, name):
+    return self._phase
+
+  def summary(self) -> dict:
+    return {}
+
+  def reset(self):
+    pass
+
+
+NULL_MONITOR = NullMonitor()
+
+
+class LoggingMonitor(Monitor):
+  """
+  Monitor that also logs every `every`-th iteration and the phase timings.
+  Attributes:
+    logger: logging.Logger to write to (defaults to the "solvers" logger).
+    level: Logging level of the records.
+    every: Log one iteration out of this many.
+  """
+  def __init__(self,
+               logger: logging.Logger=None,
+               level: int=logging.INFO,
+               every: int=1,
+               stop_when=None):
+    super().__init__(stop_when)
+    self.logger = logger or logging.getLogger("solvers")
+    self.level = level
+    self.every = every
+
+  def on_iteration(self, solver, iteration, residual=None) -> bool:
+    stop = super().on_iteration(solver, iteration, residual)
+    if iteration % self.every == 0 or stop:
+      self.logger.log(self.level, "%s iteration %d residual %s", solver, iteration, residual)
+    return stop
+
+  @contextmanager
+  def phase(self, name):
+    with super().phase(name):
+      yield
+    self.logger.log(logging.DEBUG, "phase %s total %.6fs", name, self.timings[name])
+
+  def log_summary(self):
+    for name, value in sorted(self.counters.items()):
+      self.logger.log(self.level, "counter %s = %d", name, value)
+    for name, value in sorted(self.timings.items()):
+      self.logger.log(self.level, "phase %s = %.6fs", name, value)
+
+
+class MetricsMonitor(Monitor):
+  """
+  Monitor that forwards metrics to a sink, e.g. a statsd or Prometheus client.
+  Residuals are sent as they arrive; counters and timings are sent by flush().
+  Attributes:
+    sink: Callable (name, value, tags) used to emit every metric.
+    tags: Dict of tags attached to every metric.
+  """
+  def __init__(self,
+               sink,
+               tags: dict=None,
+               stop_when=None):
+    super().__init__(stop_when)
+    self.sink = sink
+    self.tags = dict(tags or {})
+
+  def on_iteration(self, solver, iteration, residual=None) -> bool:
+    stop = super().on_iteration(solver, iteration, residual)
+    if residual is not None:
+      self.sink(f"{solver}.residual", float(residual), {**self.tags, "iteration": iteration})
+    return stop
+
+  def flush(self):
+    for name, value in self.counters.items():
+      self.sink(name, value, self.tags)
+    for name, value in self.timings.items():
+      self.sink(f"phase.{name}.seconds", value, self.tags)
+
+
+def residual_plateau(window: int=10,
+                     min_decrease: float=1e-3):
+  """
+  Returns a stop_when callable that stops a solver once its residual fell by less
+  than a fraction min_decrease over the last `window` iterations.
+  """
+  def stop(residuals: list) -> bool:
+    if len(residuals) <= window:
+      return False
+    return residuals[-1] > (1 - min_decrease) * residuals[-1 - window]
+  return stop
@@ -1,4 +1,10 @@
+import logging
 import numpy as np
+from solvers.instrumentation import NULL_MONITOR
+from solvers.mc.rollout_pool import RolloutPool
+from solvers.mc.rollouts import batched_rollout, edge_args, episode_to_tuples
+
+logger = logging.getLogger(__name__)
 
 
 def generate_episode(grid_world, 
@@ -10,21 +16,26 @@ def generate_episode(grid_world,
   Generates an episode over grid_world using policy.
   Args:
     grid_world: Instance of GridWorld class.
-    state: Initial location of agent on grid.
-    action: Selected action at this location.
-    policy: Policy to be adhered to henceforth.
+    state: Flat index (or (row, col)) of the initial location of agent on grid.
+    action: Index (or name) of the selected action at this location.
+    policy: int8 policy [H, W] (or array of action names) to be adhered to henceforth.
     length: Maximum length of the episode.
   Returns:
     episode-list of tuples of state, actionn reward,
-    final_state.
+    final_state; (row, col) states and action names if state was a tuple.
   """
+  state, action, policy, as_tuple = edge_args(grid_world, state, action, policy)
+  terminal = grid_world.model.terminal_mask
+  policy = policy.reshape(-1)
   episode = []
   for i in range(length):
-    if state in grid_world.terminal:
+    if terminal[state]:
       break
-    new_state, reward = grid_world.sample(state, action)
+    new_state, reward = grid_world.sample_index(state, action)
     episode.append((state, action, reward))
     state, action = new_state, policy[new_state]
+  if as_tuple:
+    return episode_to_tuples(grid_world, episode, state)
   return episode, state
 
 
@@ -34,33 +45,34 @@ def generate_episode_epsilon(grid_world,
                      policy, 
                      length: int=10,
                      epsilon: float=0.5)->tuple:
-    """
+  """
   Generates an episode over grid_world using (soft) policy.
   Args:
     grid_world: Instance of GridWorld class.
-    state: Initial location of agent on grid.
-    action: Selected action at this location.
-    policy: Policy to be adhered to henceforth.
+    state: Flat index (or (row, col)) of the initial location of agent on grid.
+    action: Index (or name) of the selected action at this location.
+    policy: int8 policy [H, W] (or array of action names) to be adhered to henceforth.
     length: Maximum length of the episode.
     epsilon: parameter for epsilon-greedy algorithm.
   Returns:
     episode-list of tuples of state, actionn reward,
-    final_state.
+    final_state; (row, col) states and action names if state was a tuple.
   """
+  state, action, policy, as_tuple = edge_args(grid_world, state, action, policy)
+  terminal = grid_world.model.terminal_mask
+  policy = policy.reshape(-1)
   episode = []
   N = len(grid_world.actions)
-  p = epsilon / N
-  pstar = 1 - epsilon * (N - 1)/N
   for i in range(length):
-    if state in grid_world.terminal:
+    if terminal[state]:
       break
-    new_state, reward = grid_world.sample(state, action)
+    new_state, reward = grid_world.sample_index(state, action)
     episode.append((state, action, reward))
     state = new_state
-    a_star = policy[state]
-    probs = [p for _ in grid_world.actions]
-    probs[grid_world.actions.index(a_star)] = pstar
-    action = np.random.choice(grid_world.actions, p=probs)
+    #Uniform action with prob. epsilon, else greedy: epsilon/N per action, 1 - epsilon*(N-1)/N for the greedy one.
+    action = np.random.randint(N) if np.random.random() < epsilon else policy[state]
+  if as_tuple:
+    return episode_to_tuples(grid_world, episode, state)
   return episode, state
 
 
@@ -69,47 +81,153 @@ def FirstVisit_Q_tables(grid_world,
                             Q_table, 
                             num_visits, 
                             gamma: float=0.9,
-                            length: int=100):
-  states = [state for state in grid_world.get_valid_states() if state not in grid_world.terminal]
-  actions = grid_world.actions
-  s, a = states[np.random.choice(len(states))], actions[np.random.choice(len(actions))]
-  episode, final_state = generate_episode(grid_world, s, a, policy, length) 
-  state_action_pairs_reversed = list(reversed([(s, a) for s,a,r in episode]))
-  rewards_reversed = list(reversed([r for s,a,r in episode]))
+                            length: int=100,
+                            first_seen=None,
+                            rng=None):
+  model = grid_world.model
+  rng = np.random if rng is None else rng
+  states = np.flatnonzero(model.active_mask)
+  s, a = states[rng.choice(len(states), size=1)], rng.choice(len(grid_world.actions), size=1)
+  episode_states, episode_actions, rewards, lengths, final_states = batched_rollout(model, s, a, policy, length, rng)
+  if grid_world.monitor is not None:
+    grid_world.monitor.count("env_steps", lengths.sum())
+  return FirstVisit_update(grid_world, episode_states, episode_actions, rewards, lengths, final_states,
+                           Q_table, num_visits, gamma, first_seen)
+
+
+def first_visit_mask(pairs: np.array,
+                     first_seen: np.array) -> np.array:
+  """
+  Marks the first occurrence of every value in pairs in a single O(L) pass.
+  Args:
+    pairs: Int array [L] of flat (action, state) ids.
+    first_seen: Scratch int64 array over all ids, filled with the int64 maximum;
+      it is restored before returning so it can be reused across episodes.
+  Returns:
+    Boolean array [L], True at the first visit of each pair.
+  """
+  steps = np.arange(len(pairs))
+  np.minimum.at(first_seen, pairs, steps)
+  mask = first_seen[pairs] == steps
+  first_seen[pairs] = np.iinfo(first_seen.dtype).max
+  return mask
 
-  g = grid_world.rewards[final_state].item() if final_state in grid_world.terminal else 0.0
-  for i in range(len(episode)):
-    g = rewards_reversed[i] + gamma * g 
-    s, a = state_action_pairs_reversed[i]
-    if (s, a) not in state_action_pairs_reversed[i+1:]: #First visit to (s, a) in episode
-      idx = actions.index(a)
-      num_visits[idx, s[0], s[1]] += 1
-      Q_table[idx, s[0], s[1]] += (1/ num_visits[idx, s[0], s[1]]) * (g - Q_table[idx, s[0], s[1]])
+
+def FirstVisit_update(grid_world,
+                      states,
+                      actions,
+                      rewards,
+                      lengths,
+                      final_states,
+                      Q_table,
+                      num_visits,
+                      gamma: float=0.9,
+                      first_seen=None):
+  """
+  Applies the first-visit incremental-mean update of a batch of episodes to the Q table.
+  Returns are accumulated backwards in place in rewards, and first visits are found
+  with first_visit_mask, so each episode costs O(L). Averaging all first-visit
+  returns of the batch at once gives the same table as updating episode by episode.
+  Args:
+    grid_world: Instance of GridWorld class.
+    states: Int array [N, L] of flat state indices per episode.
+    actions: Int array [N, L] of action indices per episode.
+    rewards: Array [N, L] of rewards; overwritten with the returns.
+    lengths: Int array [N] of episode lengths.
+    final_states: Int array [N] of the states the episodes ended in.
+    Q_table: Q table [A, H, W], updated in place.
+    num_visits: Visit counts [A, H, W], updated in place.
+    gamma: Discount factor.
+    first_seen: Optional scratch array for first_visit_mask, reused across calls.
+  Returns:
+    Tuple of Q_table and num_visits.
+  """
+  model = grid_world.model
+  Q_flat = Q_table.reshape(-1)
+  visits_flat = num_visits.reshape(-1)
+  if first_seen is None:
+    first_seen = np.full(Q_flat.size, np.iinfo(np.int64).max, dtype=np.int64)
+
+  g = np.where(model.terminal_mask[final_states], model.rewards[final_states], 0.0)
+  for t in range(rewards.shape[1] - 1, -1, -1):
+    g = np.where(t < lengths, rewards[:, t] + gamma * g, g)
+    rewards[:, t] = g
+  pairs, returns = [], []
+  for n in range(len(lengths)):
+    episode_pairs = actions[n, :lengths[n]].astype(np.int64) * model.num_states + states[n, :lengths[n]]
+    first = first_visit_mask(episode_pairs, first_seen)
+    pairs.append(episode_pairs[first])
+    returns.append(rewards[n, :lengths[n]][first])
+  seen, inverse = np.unique(np.concatenate(pairs), return_inverse=True)
+  counts = np.bincount(inverse)
+  totals = np.bincount(inverse, weights=np.concatenate(returns))
+  visits_flat[seen] += counts
+  Q_flat[seen] += (totals - counts * Q_flat[seen]) / visits_flat[seen]
   return Q_table, num_visits 
 
 
 def FirstVisit_PolicyImprovement(grid_world, 
                                  gamma: float=0.9, 
                                  length: int=25, 
-                                 max_iter: int=25):
-  states = grid_world.get_valid_states()
+                                 max_iter: int=25,
+                                 num_workers: int=None,
+                                 episodes_per_worker: int=64,
+                                 seed=None,
+                                 monitor=None,
+                                 as_actions: bool=False):
+  """
+  First-visit Monte Carlo control with exploring starts.
+  Args:
+    grid_world: Instance of GridWorld class.
+    gamma: Discount factor.
+    length: Maximum length of the episodes.
+    max_iter: Maximum number of policy improvement passes.
+    num_workers: If set, episodes are generated on a RolloutPool of this many
+      processes, num_workers * episodes_per_worker of them per pass.
+    episodes_per_worker: Episodes generated by each worker per pass; each task
+      costs a round trip to the worker, so small batches are dominated by it.
+    seed: Seed for the initial policy, the start pairs and the slips (the
+      workers' generators with num_workers); with a seed the result is
+      reproducible for a given num_workers, or for the serial path.
+    monitor: Optional solvers.instrumentation.Monitor; gets the number of changed
+      states per pass and the "rollout" / "update" phase times.
+    as_actions: if True, return the '<U5' array of action names ("" on walls and
+      terminal states) instead, as this function used to.
+  Returns:
+    int8 policy [H, W] of action indices, -1 on walls and terminal states
+    (see GridWorld.policy_to_actions for the action names).
+  """
+  active = grid_world.model.active_mask.reshape(grid_world.height, grid_world.width)
   actions = grid_world.actions
-  policy = np.full((grid_world.height, grid_world.width), "", dtype='<U5')
-  for state in states:
-    if state not in grid_world.terminal:
-      policy[state] = actions[np.random.choice([0, 1, 2, 3])]
+  rng = np.random if seed is None else np.random.default_rng(seed)
+  policy = np.full((grid_world.height, grid_world.width), -1, dtype=np.int8)
+  policy[active] = rng.choice([0, 1, 2, 3], size=np.count_nonzero(active))
   new_policy = policy.copy()
   Q_table = np.zeros((len(actions), grid_world.height, grid_world.width))
   num_visits = np.zeros((len(actions), grid_world.height, grid_world.width)) #to offset div by 0.
+  first_seen = np.full(Q_table.size, np.iinfo(np.int64).max, dtype=np.int64) #Scratch for first_visit_mask.
+  pool = RolloutPool(grid_world, num_workers, seed) if num_workers else None
+  monitor = NULL_MONITOR if monitor is None else monitor
   
-  for iter in range(max_iter):
-    Q_table, num_visits = FirstVisit_Q_tables(grid_world, policy, Q_table, num_visits, gamma, length)
-    for state in states:
-      if state not in grid_world.terminal:
-        new_policy[state] = actions[np.argmax(Q_table[:, state[0], state[1]], axis=0)]
-    if np.array_equal(policy, new_policy): 
-      print(f"Converged after {iter + 1} passes...")
-      break
-    policy = new_policy.copy()
-  return policy
-
+  try:
+    for iter in range(max_iter):
+      if pool is None:
+        with monitor.phase("rollout"):
+          Q_table, num_visits = FirstVisit_Q_tables(grid_world, policy, Q_table, num_visits, gamma, length, first_seen, rng)
+      else:
+        with monitor.phase("rollout"):
+          episodes = pool.generate(policy, episodes_per_worker, length)
+        if grid_world.monitor is not None:
+          grid_world.monitor.count("env_steps", episodes[3].sum())
+        with monitor.phase("update"):
+          Q_table, num_visits = FirstVisit_update(grid_world, *episodes, Q_table, num_visits, gamma, first_seen)
+      new_policy[active] = np.argmax(Q_table[:, active], axis=0)
+      changed = int(np.count_nonzero(new_policy != policy))
+      if monitor.on_iteration("first_visit_mc", iter, changed) or changed == 0:
+        logger.info("Stopped after %d passes...", iter + 1)
+        break
+      policy = new_policy.copy()
+  finally:
+    if pool is not None:
+      pool.close()
+  return grid_world.policy_to_actions(policy) if as_actions else policy
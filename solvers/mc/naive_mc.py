@@ -1,86 +1,162 @@
 import numpy as np
+from solvers.instrumentation import NULL_MONITOR
+from solvers.mc.rollouts import batched_rollout, edge_args, episode_to_tuples
 
 
-def generate_episode(grid_world, 
-                     state, 
-                     action, 
-                     policy, 
+def generate_episode(grid_world,
+                     state,
+                     action,
+                     policy,
                      length: int=10)->list:
+  """
+  Generates an episode over grid_world using policy.
+  States and actions are flat indices; (row, col) states, action names and '<U5'
+  policies are converted (see edge_args), and with a (row, col) start the episode
+  comes back in those terms too.
+  Returns:
+    episode-list of tuples of state, action, reward, and the final state.
+  """
+  state, action, policy, as_tuple = edge_args(grid_world, state, action, policy)
+  terminal = grid_world.model.terminal_mask
+  policy = policy.reshape(-1)
   episode = []
   for i in range(length):
-    if state in grid_world.terminal:
+    if terminal[state]:
       break
-    new_state, reward = grid_world.sample(state, action)
+    new_state, reward = grid_world.sample_index(state, action)
     episode.append((state, action, reward))
     state, action = new_state, policy[new_state]
+  if as_tuple:
+    return episode_to_tuples(grid_world, episode, state)
   return episode, state
 
 
-def get_q_value_estimate(grid_world, 
-                         state, 
-                         action, 
-                         policy, 
+def get_q_value_estimate(grid_world,
+                         state,
+                         action,
+                         policy,
                          gamma: float=0.9,
-                         length: int=10, 
+                         length: int=10,
                          samples: int=5):
-  q = 0.0 
+  model = grid_world.model
+  state, action, policy, _ = edge_args(grid_world, state, action, policy)
+  q = 0.0
   for _ in range(samples):
     episode, final_state = generate_episode(grid_world, state, action, policy, length)
     if len(episode) == 0:
       continue
-    if final_state in grid_world.terminal:
-      q_episode = grid_world.rewards[final_state].item()
+    if model.terminal_mask[final_state]:
+      q_episode = model.rewards[final_state].item()
     else:
       q_episode = 0.0
     rewards_only = [exp[2] for exp in episode]
     for reward in reversed(rewards_only):
       q_episode = reward + gamma * q_episode
     q += q_episode
-  return q / samples 
+  return q / samples
 
 
-def QValue_MC_Estimate(grid_world, 
-                       policy, 
+def QValue_MC_Estimate(grid_world,
+                       policy,
                        gamma: float=0.9,
-                       length:int=10, 
+                       length:int=10,
                        samples: int=10):
-  states = grid_world.get_valid_states()
+  model = grid_world.model
+  states = np.flatnonzero(model.active_mask).tolist()
   actions = grid_world.actions
   Q = np.zeros(( len(actions), grid_world.height, grid_world.width)) #[A, H, W]
+  Q_flat = Q.reshape(len(actions), -1)
   for state in states:
-    if state not in grid_world.terminal:
-      for a in range(len(actions)):
-        Q[a, state[0], state[1]] = get_q_value_estimate(grid_world, state, actions[a], policy, gamma,length, samples)
+    for a in range(len(actions)):
+      Q_flat[a, state] = get_q_value_estimate(grid_world, state, a, policy, gamma,length, samples)
   return Q
 
 
-def MC_PolicyImprovement(grid_world, 
+def QValue_MC_Estimate_batched(grid_world,
+                               policy,
+                               gamma: float=0.9,
+                               length: int=10,
+                               samples: int=10,
+                               rng=None,
+                               max_rows: int=2**18):
+  """
+  Batched version of QValue_MC_Estimate: rolls out every (state, action, sample)
+  episode together and computes the returns with one discount dot-product.
+  Args:
+    grid_world: Instance of GridWorld class.
+    policy: int8 policy [H, W] to follow after the first action.
+    gamma: Discount factor.
+    length: Maximum length of the episodes.
+    samples: Number of episodes per (state, action) pair.
+    rng: numpy Generator (or the np.random module, the default).
+    max_rows: Maximum number of episodes rolled out at once, to bound memory.
+  Returns:
+    Q table [A, H, W].
+  """
+  model = grid_world.model
+  num_actions = len(grid_world.actions)
+  states = np.flatnonzero(model.active_mask)
+  Q = np.zeros((num_actions, grid_world.height, grid_world.width)) #[A, H, W]
+  Q_flat = Q.reshape(num_actions, -1)
+  discounts = gamma ** np.arange(length)
+  rows_per_state = num_actions * samples
+  chunk = max(1, max_rows // rows_per_state)
+  for start in range(0, len(states), chunk):
+    block = states[start:start + chunk]
+    start_states = np.repeat(block, rows_per_state)
+    start_actions = np.tile(np.repeat(np.arange(num_actions), samples), len(block))
+    _, _, rewards, lengths, final_states = batched_rollout(model, start_states, start_actions,
+                                                           policy, length, rng)
+    if grid_world.monitor is not None:
+      grid_world.monitor.count("env_steps", lengths.sum())
+    bootstrap = np.where(model.terminal_mask[final_states], model.rewards[final_states], 0.0)
+    returns = rewards @ discounts + gamma ** lengths * bootstrap
+    Q_flat[:, block] = returns.reshape(len(block), num_actions, samples).mean(axis=2).T
+  return Q
+
+
+def MC_PolicyImprovement(grid_world,
                          Q):
-  states = grid_world.get_valid_states()
-  actions = grid_world.actions
-  policy = np.full((grid_world.height, grid_world.width), None)
-  for state in states:
-    if state not in grid_world.terminal:
-      policy[state] = actions[np.argmax(Q[:, state[0], state[1]], axis=0)]
-  return policy
+  model = grid_world.model
+  policy = np.full(model.num_states, -1, dtype=np.int8)
+  states = np.flatnonzero(model.active_mask)
+  policy[states] = np.argmax(Q.reshape(len(grid_world.actions), -1)[:, states], axis=0)
+  return policy.reshape(grid_world.height, grid_world.width)
 
 
-def MC_naive_PolicyIteration(grid_world, 
-                             gamma: float=0.9, 
-                             length: int=25, 
-                             samples:int=20, 
-                             max_iter: int=20):
-  states = grid_world.get_valid_states()
-  actions = grid_world.actions
-  policy = np.full((grid_world.height, grid_world.width), "", dtype='<U5')
-  for state in states:
-    if state not in grid_world.terminal:
-      policy[state] = actions[np.random.choice([0, 1, 2, 3])]
+def MC_naive_PolicyIteration(grid_world,
+                             gamma: float=0.9,
+                             length: int=25,
+                             samples:int=20,
+                             max_iter: int=20,
+                             batched: bool=True,
+                             monitor=None,
+                             as_actions: bool=False):
+  """
+  Monte Carlo policy iteration with naive return estimates for every (state, action).
+  With batched=True the estimates come from QValue_MC_Estimate_batched.
+  An optional solvers.instrumentation.Monitor gets the number of changed states per
+  iteration and the "rollout" / "improvement" phase times. With as_actions=True the
+  policy comes back as the '<U5' array of action names it used to be.
+  Returns:
+    Tuple of the int8 policy [H, W] (action indices, -1 on walls and terminal
+    states; see GridWorld.policy_to_actions) and the Q table [A, H, W].
+  """
+  model = grid_world.model
+  policy = np.full((grid_world.height, grid_world.width), -1, dtype=np.int8)
+  policy[model.active_mask.reshape(policy.shape)] = np.random.choice([0, 1, 2, 3], size=np.count_nonzero(model.active_mask))
 
+  monitor = NULL_MONITOR if monitor is None else monitor
   for iter in range(max_iter):
-    Q = QValue_MC_Estimate(grid_world, policy, gamma, length, samples)
-    new_policy = MC_PolicyImprovement(grid_world, Q)
-    if np.array_equal(policy, new_policy): 
+    with monitor.phase("rollout"):
+      if batched:
+        Q = QValue_MC_Estimate_batched(grid_world, policy, gamma, length, samples)
+      else:
+        Q = QValue_MC_Estimate(grid_world, policy, gamma, length, samples)
+    with monitor.phase("improvement"):
+      new_policy = MC_PolicyImprovement(grid_world, Q)
+    changed = int(np.count_nonzero(new_policy != policy))
+    if monitor.on_iteration("mc_naive", iter, changed) or changed == 0:
       break
     policy = new_policy
-  return policy, Q
+  return (grid_world.policy_to_actions(policy) if as_actions else policy), Q
@@ -0,0 +1,84 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from grid_world.model import TransitionModel
+from solvers.mc.rollouts import batched_rollout
+from solvers.shared import SharedArrays, attach_arrays
+
+
+_MODEL_ARRAYS = ("wall_mask", "terminal_mask", "rewards", "next_state", "indices", "data", "R")
+
+_worker = {} #Per-process state set up by _init_worker.
+
+
+def _init_worker(spec: dict, height: int, width: int, actions: list):
+  arrays, blocks = attach_arrays(spec)
+  _worker["blocks"] = blocks
+  _worker["model"] = TransitionModel(height, width, actions, *(arrays[key] for key in _MODEL_ARRAYS))
+
+
+def _rollout_task(policy: np.array,
+                  num_episodes: int,
+                  length: int,
+                  seed: np.random.SeedSequence) -> tuple:
+  model = _worker["model"]
+  rng = np.random.default_rng(seed)
+  states = np.flatnonzero(model.active_mask)
+  start_states = states[rng.integers(len(states), size=num_episodes)]
+  start_actions = rng.integers(model.num_actions, size=num_episodes)
+  episode_states, episode_actions, rewards, lengths, final_states = batched_rollout(
+      model, start_states, start_actions, policy, length, rng)
+  used = int(lengths.max(initial=0)) #Trim the unused tail before shipping back.
+  return (episode_states[:, :used], episode_actions[:, :used], rewards[:, :used],
+          lengths.astype(np.int32), final_states.astype(np.int32))
+
+
+class RolloutPool:
+  """
+  Generates exploring-start episodes on a pool of worker processes.
+  The compiled model is placed in shared memory once; each task only carries the
+  current policy. Every call spawns one SeedSequence child per worker task, so the
+  episodes are reproducible for a given seed and num_workers regardless of
+  scheduling.
+  Attributes:
+    num_workers: Number of worker processes (and tasks per call).
+  """
+  def __init__(self,
+               grid_world,
+               num_workers: int=4,
+               seed=None):
+    model = grid_world.model
+    self.num_workers = num_workers
+    self._seed_seq = np.random.SeedSequence(seed)
+    self._shared = SharedArrays({key: getattr(model, key) for key in _MODEL_ARRAYS})
+    self._executor = ProcessPoolExecutor(max_workers=num_workers,
+                                         initializer=_init_worker,
+                                         initargs=(self._shared.spec, model.height, model.width, model.actions))
+
+  def generate(self,
+               policy: np.array,
+               episodes_per_worker: int=1,
+               length: int=25) -> tuple:
+    """
+    Generates num_workers * episodes_per_worker episodes following policy after
+    a random first (state, action).
+    Returns:
+      Tuple of the episode states [N, L], actions [N, L], rewards [N, L],
+      lengths [N] and final states [N], in task order.
+    """
+    seeds = self._seed_seq.spawn(self.num_workers)
+    futures = [self._executor.submit(_rollout_task, policy, episodes_per_worker, length, seed) for seed in seeds]
+    results = [future.result() for future in futures]
+    width = max(result[0].shape[1] for result in results)
+    padded = [[np.pad(part, ((0, 0), (0, width - part.shape[1]))) for part in result[:3]] for result in results]
+    return tuple(np.concatenate(parts) for parts in zip(*padded)) + \
+           tuple(np.concatenate([result[k] for result in results]) for k in (3, 4))
+
+  def close(self):
+    self._executor.shutdown()
+    self._shared.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def batched_rollout(model,
+                    states: np.array,
+                    actions: np.array,
+                    policy: np.array,
+                    length: int=10,
+                    rng=None)->tuple:
+  """
+  Rolls out one episode per (state, action) row, all rows stepping together.
+  Each row starts with its given action and follows policy afterwards; rows that
+  reach a terminal state are masked out for the remaining steps.
+  Args:
+    model: TransitionModel of the grid (GridWorld.model).
+    states: Int array [N] of flat start states.
+    actions: Int array [N] of first actions.
+    policy: int policy [H, W] (or flat [S]) of action indices.
+    length: Maximum length of the episodes.
+    rng: numpy Generator (or the np.random module, the default) for the slips.
+  Returns:
+    Tuple of the visited states [N, length], the actions taken [N, length],
+    the rewards [N, length] (0 after termination), the episode lengths [N]
+    and the final states [N].
+  """
+  rng = np.random if rng is None else rng
+  policy = policy.reshape(-1)
+  n = len(states)
+  episode_states = np.zeros((n, length), dtype=np.int32)
+  episode_actions = np.zeros((n, length), dtype=np.int8)
+  rewards = np.zeros((n, length))
+  lengths = np.zeros(n, dtype=np.int64)
+  state = np.asarray(states, dtype=np.int64).copy()
+  action = np.asarray(actions, dtype=np.int64).copy()
+  alive = ~model.terminal_mask[state]
+  for t in range(length):
+    if not alive.any():
+      break
+    episode_states[:, t] = state
+    episode_actions[:, t] = action
+    probs = model.next_prob[state, action]
+    u = rng.random(n)
+    outcome = (u >= probs[:, 0]).astype(np.int64) + (u >= probs[:, 0] + probs[:, 1])
+    new_state = model.next_idx[state, action, outcome]
+    reward = model.R[state, action] + np.where(model.terminal_mask[new_state], model.rewards[new_state], 0.0)
+    rewards[:, t] = np.where(alive, reward, 0.0)
+    lengths += alive
+    state = np.where(alive, new_state, state)
+    action = policy[state].astype(np.int64)
+    alive &= ~model.terminal_mask[state]
+  return episode_states, episode_actions, rewards, lengths, state
+
+
+def edge_args(grid_world,
+              state,
+              action,
+              policy) -> tuple:
+  """
+  Converts the (row, col) / action-name arguments the episode generators used to
+  take into the flat indices they work on; index arguments pass through unchanged.
+  Args:
+    grid_world: Instance of GridWorld class.
+    state: Flat state index or (row, col) tuple.
+    action: Action index or name.
+    policy: int policy [H, W] or '<U5' array of action names.
+  Returns:
+    Tuple of the state index, the action index, the int policy and whether state
+    was given as a tuple (see episode_to_tuples).
+  """
+  as_tuple = isinstance(state, tuple)
+  if as_tuple:
+    state = grid_world.state_to_index(state)
+  if isinstance(action, str):
+    action = grid_world.actions.index(action)
+  policy = np.asarray(policy)
+  if policy.dtype.kind not in "iuf":
+    policy = grid_world.policy_from_actions(policy)
+  return state, action, policy, as_tuple
+
+
+def episode_to_tuples(grid_world,
+                      episode: list,
+                      final_state: int) -> tuple:
+  """
+  Converts an episode of (state index, action index, reward) back to (row, col)
+  states and action names, with the final state as a (row, col) tuple.
+  """
+  actions = grid_world.actions
+  return ([(grid_world.index_to_state(s), actions[a], r) for s, a, r in episode],
+          grid_world.index_to_state(final_state))
@@ -1,19 +1,96 @@
+import logging
 import numpy as np
-from utils import policy_evaluation, policy_improvement
+from grid_world.environment import GridWorld
+from solvers.instrumentation import NULL_MONITOR
+from solvers.utils import (greedy_policy, partial_policy_evaluation, policy_evaluation, policy_improvement,
+                           policy_improvement_incremental)
+
+logger = logging.getLogger(__name__)
 
 
 def policy_iteration(grid_world: GridWorld,
                      gamma: float=0.9,
                      theta: float=1e-6,
-                     max_iter: int=500):
-  policy = np.full((grid_world.height, grid_world.width), 1, dtype=int)
+                     max_iter: int=500,
+                     method: str="sweep",
+                     k: int=None,
+                     return_stats: bool=False,
+                     monitor=None,
+                     V_init: np.array=None):
+  """
+  Performs Policy Iteration for solving the Grid World problem.
+  Parameters:
+    grid_world: an instance of the GridWorld class defining the problem.
+    gamma: discount factor for the returns.
+    theta: convergence threshold for the evaluation step.
+    max_iter: maximum number of policy iterations.
+    method: policy_evaluation method ("sweep", "direct" or "krylov").
+    k: if set, run modified policy iteration instead: k partial evaluation sweeps per
+      iteration and incremental improvement of the states whose values moved.
+    return_stats: if True, also return a dict with per-iteration counts of changed states.
+    monitor: optional solvers.instrumentation.Monitor; gets the number of changed states
+      of every iteration as its residual and the "evaluation" / "improvement" phase times.
+    V_init: optional values [H, W] to warm start from: the first policy is greedy with
+      respect to them and the first evaluation starts from them.
+  Returns:
+    Tuple (V, policy), followed by the stats dict if return_stats is set.
+  """
+  monitor = NULL_MONITOR if monitor is None else monitor
+  if k is not None:
+    V, policy, stats = _modified_policy_iteration(grid_world, gamma, theta, max_iter, k, monitor, V_init)
+    return (V, policy, stats) if return_stats else (V, policy)
+  model = grid_world.model
+  shape = (grid_world.height, grid_world.width)
+  #-1 on walls and terminal states, as policy_improvement returns, so only active states count as changed.
+  policy = np.where(model.active_mask, 1, -1).reshape(shape)
+  V = None
+  if V_init is not None:
+    V = np.where(grid_world.terminal_mask, model.rewards.reshape(shape), V_init)
+    policy = greedy_policy(model, V, gamma)
+  changed_states = []
   for iter in range(max_iter):
-    print(f"Policy Iteration Step {iter}")
-    V = policy_evaluation(grid_world, policy, gamma)
-    new_policy = policy_improvement(grid_world, V, gamma)
-    if np.array_equal(policy, new_policy):
+    logger.info("Policy Iteration Step %d", iter)
+    with monitor.phase("evaluation"):
+      V = policy_evaluation(grid_world, policy, gamma, method=method, V_init=V, monitor=monitor) #Warm start from the previous policy's values.
+    with monitor.phase("improvement"):
+      new_policy = policy_improvement(grid_world, V, gamma)
+    changed_states.append(int(np.count_nonzero(new_policy != policy)))
+    monitor.snapshot("policy_iteration", iter, V, changed_states[-1])
+    if monitor.on_iteration("policy_iteration", iter, changed_states[-1]) or np.array_equal(policy, new_policy):
       break
     policy = new_policy.copy()
+  if return_stats:
+    return V, policy, {"iterations": iter + 1, "changed_states": changed_states}
   return V, policy
 
 
+def _modified_policy_iteration(grid_world: GridWorld,
+                               gamma: float=0.9,
+                               theta: float=1e-6,
+                               max_iter: int=500,
+                               k: int=5,
+                               monitor=NULL_MONITOR,
+                               V_init: np.array=None):
+  model = grid_world.model
+  V = np.where(model.terminal_mask, model.rewards, 0.0 if V_init is None else np.ravel(V_init))
+  policy = np.where(model.active_mask, 1, -1) if V_init is None else greedy_policy(model, V, gamma).ravel()
+  region = None #None means every active state.
+  changed_states, backups = [], []
+  for iter in range(max_iter):
+    with monitor.phase("evaluation"):
+      touched, frontier, n_backups = partial_policy_evaluation(model, policy, V, gamma, theta, k, region)
+    with monitor.phase("improvement"):
+      #After the first pass only states next to moved values can change their greedy action.
+      candidates = None if iter == 0 else model.predecessors_of(touched)
+      changed = policy_improvement_incremental(model, V, policy, gamma, candidates)
+    changed_states.append(int(changed.size))
+    backups.append(n_backups)
+    monitor.count("backups", n_backups)
+    logger.info("Policy Iteration Step %d: %d states changed action", iter, changed.size)
+    region = np.union1d(frontier, changed)
+    monitor.snapshot("policy_iteration", iter, V.reshape(grid_world.height, grid_world.width), changed.size)
+    if monitor.on_iteration("policy_iteration", iter, changed.size) or region.size == 0:
+      break
+  V = V.reshape(grid_world.height, grid_world.width)
+  policy = policy.reshape(grid_world.height, grid_world.width)
+  return V, policy, {"iterations": iter + 1, "changed_states": changed_states, "backups": backups}
@@ -0,0 +1,53 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class SharedArrays:
+  """
+  Places a set of numpy arrays in shared memory so that worker processes can map
+  them read-only instead of receiving pickled copies with every task.
+  Attributes:
+    arrays: Dict of name -> numpy array backed by the shared blocks.
+    spec: Picklable description (block name, shape, dtype) to pass to attach_arrays.
+  """
+  def __init__(self, arrays: dict):
+    self._blocks = []
+    self.arrays = {}
+    self.spec = {}
+    for key, array in arrays.items():
+      array = np.ascontiguousarray(array)
+      block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+      shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+      shared[...] = array
+      self._blocks.append(block)
+      self.arrays[key] = shared
+      self.spec[key] = (block.name, array.shape, array.dtype.str)
+
+  def close(self):
+    """Releases and unlinks the shared blocks. The arrays must not be used afterwards."""
+    self.arrays = {}
+    for block in self._blocks:
+      block.close()
+      block.unlink()
+    self._blocks = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def attach_arrays(spec: dict) -> tuple:
+  """
+  Maps the arrays described by SharedArrays.spec in the current process.
+  Returns:
+    Tuple of the dict of arrays and the list of SharedMemory handles, which must
+    stay referenced for as long as the arrays are used.
+  """
+  arrays, blocks = {}, []
+  for key, (name, shape, dtype) in spec.items():
+    block = shared_memory.SharedMemory(name=name)
+    arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    blocks.append(block)
+  return arrays, blocks
@@ -0,0 +1,122 @@
+import glob
+import os
+import queue
+import threading
+import time
+import numpy as np
+from grid_world.rendering import downsample
+from solvers.instrumentation import Monitor
+
+
+class SnapshotStream(Monitor):
+  """
+  Monitor that records the values of a solve as a stream of compressed .npz frames,
+  for watching convergence (see read_snapshots).
+  At most fps frames per second are kept; a snapshot arriving sooner is dropped
+  after one clock read. A kept frame is copied on the solver's thread and handed
+  to a background thread that downsamples it to max_shape, compresses and writes
+  it, so the solver never waits for the disk; if max_queue frames are already
+  waiting, the new one is dropped instead. Each frame file holds V, iteration,
+  residual, solver and the seconds since the stream started.
+  The last iteration of a solve is only recorded if it falls on a kept frame;
+  pass the returned V to capture() to always end on the solution.
+  Attributes:
+    directory: Directory of the frame_<n>.npz files, created if missing.
+    fps: Largest number of frames kept per second (None keeps every snapshot).
+    max_shape: Larger grids are block-averaged down to this shape, or None.
+    dtype: dtype the frames are stored in; float32 halves the compression work.
+    frames: Number of frames handed to the writer.
+    dropped: Number of snapshots skipped by the frame rate or a full queue.
+  """
+  def __init__(self,
+               directory: str,
+               fps: float=5,
+               max_shape: tuple=(256, 256),
+               dtype=np.float32,
+               max_queue: int=8,
+               stop_when=None):
+    super().__init__(stop_when)
+    self.directory = directory
+    self.fps = fps
+    self.max_shape = max_shape
+    self.dtype = dtype
+    self.frames = self.dropped = 0
+    os.makedirs(directory, exist_ok=True)
+    self._start = time.perf_counter()
+    self._last = -float("inf")
+    self._queue = queue.Queue(maxsize=max_queue)
+    self._error = None
+    self._writer = threading.Thread(target=self._write_frames, name="SnapshotStream", daemon=True)
+    self._writer.start()
+
+  def snapshot(self, solver, iteration, V, residual=None):
+    now = time.perf_counter()
+    if self.fps is not None and now - self._last < 1 / self.fps:
+      self.dropped += 1
+      return
+    self._last = now
+    self.capture(V, iteration, residual, solver, now)
+
+  def capture(self,
+              V: np.array,
+              iteration: int=-1,
+              residual: float=None,
+              solver: str="",
+              now: float=None) -> bool:
+    """
+    Queues a frame of V regardless of the frame rate. Returns False if it was dropped
+    because the writer is behind.
+    """
+    if self._error is not None:
+      raise RuntimeError("SnapshotStream writer failed") from self._error
+    frame = {"V": np.array(V), #The solver keeps updating its array.
+             "iteration": iteration,
+             "residual": np.nan if residual is None else float(residual),
+             "solver": solver,
+             "time": (time.perf_counter() if now is None else now) - self._start}
+    try:
+      self._queue.put_nowait((self.frames, frame))
+    except queue.Full:
+      self.dropped += 1
+      return False
+    self.frames += 1
+    return True
+
+  def _write_frames(self):
+    while (item := self._queue.get()) is not None:
+      number, frame = item
+      path = os.path.join(self.directory, f"frame_{number:06d}.npz")
+      try:
+        if self.max_shape is not None:
+          frame["V"] = downsample(frame["V"], self.max_shape, "mean")
+        frame["V"] = frame["V"].astype(self.dtype, copy=False)
+        with open(path + ".tmp", "wb") as f:
+          np.savez_compressed(f, **frame)
+        os.replace(path + ".tmp", path) #Readers never see a partial frame.
+      except Exception as e:
+        self._error = e
+        return
+
+  def close(self):
+    """Writes the queued frames and stops the writer thread; raises if the writer failed."""
+    if self._writer.is_alive():
+      self._queue.put(None)
+      self._writer.join()
+    if self._error is not None:
+      raise RuntimeError("SnapshotStream writer failed") from self._error
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def read_snapshots(directory: str):
+  """
+  Yields the frames written by a SnapshotStream in order, as dicts with V,
+  iteration, residual, solver and time.
+  """
+  for path in sorted(glob.glob(os.path.join(directory, "frame_*.npz"))):
+    with np.load(path) as data:
+      yield {key: data[key] if data[key].ndim else data[key].item() for key in data.files}
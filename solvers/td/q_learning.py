@@ -1,4 +1,6 @@
 import numpy as np
+from grid_world.vec_env import VecGridWorld
+from solvers.instrumentation import NULL_MONITOR
 
 
 def q_learning(grid_world,
@@ -9,7 +11,9 @@ def q_learning(grid_world,
                epsilon_end: float= 0.1,
                epsilon_decay: float=0.9,
                alpha: float=0.1,
-               num_episodes: int=50):
+               num_episodes: int=50,
+               monitor=None,
+               as_actions: bool=False):
   """
   Executes Q Learning to find 'optimal' path between initial and target states.
   Args:
@@ -22,29 +26,43 @@ def q_learning(grid_world,
     epsilon_decay: Ratio by which to decrease epsilon over every episode.
     alpha: 'learning rate' for RM algorithm.
     num_episodes: Number of episodes to use in policy/path determination.
+    monitor: Optional solvers.instrumentation.Monitor, given the largest TD error of
+      every episode (and able to stop training).
+    as_actions: if True, return the '<U5' array of action names ("" on walls and
+      terminal states) instead, as this function used to.
   Returns:
-    final policy learnt to chart path between initial_state and target_state. 
+    final int8 policy [H, W] learnt to chart path between initial_state and target_state,
+    -1 on walls and terminal states (see GridWorld.policy_to_actions).
   """
 
-  states = [state for state in grid_world.get_valid_states() if state not in grid_world.terminal]
+  model = grid_world.model
   actions = grid_world.actions
   Q_table = np.zeros((len(actions), grid_world.height, grid_world.width))             #Initialization of Q table of shape [num_actions, H, W]
+  Q_flat = Q_table.reshape(len(actions), -1)                                          #[num_actions, S] view indexed by flat state
+  initial_state = grid_world.state_to_index(initial_state)                            #Tuples only at the edges, flat ints inside.
+  target_state = grid_world.state_to_index(target_state)
+  terminal = model.terminal_mask
   epsilon = epsilon_start
+  monitor = NULL_MONITOR if monitor is None else monitor
   for episode in range(num_episodes):                                                 #Outer loop over N episodes
     current_state = initial_state                                                     #Position initialized for each episode
     epsilon = max(epsilon_end, epsilon_decay * epsilon)
-    while current_state != target_state and current_state not in grid_world.terminal: #Inner loop for each episode
+    max_error = 0.0
+    while current_state != target_state and not terminal[current_state]:              #Inner loop for each episode
       action, reward, new_state = soft_policy_step(grid_world, 
                                                    current_state, 
                                                    Q_table, epsilon)                  #a, r, s' from epsilon greedy step.
-      Q_table[actions.index(action), current_state[0], current_state[1]] -= \
-      alpha * (Q_table[actions.index(action), current_state[0], current_state[1]] 
-               - (reward + gamma * max(Q_table[:, new_state[0], new_state[1]])))      #RM step update for Q table
+      td_error = Q_flat[action, current_state] - (reward + gamma * Q_flat[:, new_state].max())
+      Q_flat[action, current_state] -= alpha * td_error                               #RM step update for Q table
+      max_error = max(max_error, abs(td_error))
       current_state = new_state 
-  policy = np.full((grid_world.height, grid_world.width), "", dtype='<U5')            #Random Initialization of policy
-  for state in states:
-    policy[state] = actions[np.argmax(Q_table[:, state[0], state[1]], axis=0)]        #Update policy.
-  return policy
+    if monitor.on_iteration("q_learning", episode, max_error):
+      break
+  policy = np.full(model.num_states, -1, dtype=np.int8)
+  states = np.flatnonzero(model.active_mask)
+  policy[states] = np.argmax(Q_flat[:, states], axis=0)                               #Update policy.
+  policy = policy.reshape(grid_world.height, grid_world.width)
+  return grid_world.policy_to_actions(policy) if as_actions else policy
 
 
 def soft_policy_step(grid_world, 
@@ -55,20 +73,101 @@ def soft_policy_step(grid_world,
   Takes 1 step in grid world instance using an epsilon greedy policy.
   Args:
     grid_world: Instance of GridWorld class.
-    state: Current position of agent.
+    state: Flat index of the current position of agent.
     Q_table: Current table of state action values.
     epsilon: Parameter for epsilon-greedy policy version.
   Returns:
-    tuple of selected action, reward and new state.
+    tuple of selected action index, reward and new state index.
   """
   N = len(grid_world.actions)
-  p = epsilon / N
-  pstar = 1 - epsilon * (N - 1)/N
-  probs = [p for _ in grid_world.actions]
-  action = grid_world.actions[np.argmax(Q_table[:, state[0], state[1]], axis=0)]
-  probs[grid_world.actions.index(action)] = pstar
-  selected_action = np.random.choice(grid_world.actions, p=probs).item()
-  new_state, reward = grid_world.sample(state, selected_action)
+  if np.random.random() < epsilon:                                                    #epsilon/N per action, 1 - epsilon*(N-1)/N for the greedy one.
+    selected_action = np.random.randint(N)
+  else:
+    selected_action = int(np.argmax(Q_table.reshape(N, -1)[:, state]))
+  new_state, reward = grid_world.sample_index(state, selected_action)
   return selected_action, reward, new_state
 
 
+def q_learning_batched(grid_world,
+                       initial_state: tuple,
+                       target_state: tuple,
+                       gamma: float,
+                       epsilon_start: float=1.0,
+                       epsilon_end: float= 0.1,
+                       epsilon_decay: float=0.9,
+                       alpha: float=0.1,
+                       num_batches: int=50,
+                       num_envs: int=64,
+                       epsilon_schedule=None,
+                       max_steps: int=10000,
+                       seed: int=None,
+                       monitor=None,
+                       as_actions: bool=False):
+  """
+  Q Learning with num_envs independent episodes run together against one Q table.
+  Action selection is a single argmax over the batch, and the TD updates are
+  scattered with np.add.at, so agents updating the same (action, state) cell in
+  the same step all contribute.
+  Args:
+    grid_world: Instance of GridWorld class.
+    initial_state: Starting position of every agent on the grid.
+    target_state: Desired position of the agents on the grid.
+    gamma: Discount factor.
+    epsilon_start: Initial parameter for epsilon-greedy policy version.
+    epsilon_end: Lowest value of epsilon.
+    epsilon_decay: Ratio by which to decrease epsilon over every batch.
+    alpha: 'learning rate' for RM algorithm.
+    num_batches: Number of batches of num_envs episodes.
+    num_envs: Number of episodes run together in each batch.
+    epsilon_schedule: Optional sequence (or callable of the batch number) giving the
+      epsilon of each batch; overrides the start/end/decay schedule.
+    max_steps: Maximum number of steps per batch.
+    seed: Seed for the random generator.
+    monitor: Optional solvers.instrumentation.Monitor, given the largest TD error of
+      every batch (and able to stop training).
+    as_actions: if True, return the '<U5' array of action names instead.
+  Returns:
+    final int8 policy [H, W], as in q_learning.
+  """
+  env = VecGridWorld(grid_world, num_envs, seed=seed)
+  model = grid_world.model
+  num_actions = len(grid_world.actions)
+  Q_table = np.zeros((num_actions, grid_world.height, grid_world.width))
+  Q_flat = Q_table.reshape(num_actions, -1)
+  initial_state = grid_world.state_to_index(initial_state)
+  target_state = grid_world.state_to_index(target_state)
+  finished = model.terminal_mask.copy()
+  finished[target_state] = True
+  epsilon = epsilon_start
+  monitor = NULL_MONITOR if monitor is None else monitor
+  for batch in range(num_batches):
+    if epsilon_schedule is None:
+      epsilon = max(epsilon_end, epsilon_decay * epsilon)
+    elif callable(epsilon_schedule):
+      epsilon = epsilon_schedule(batch)
+    else:
+      epsilon = epsilon_schedule[batch]
+    states = np.full(num_envs, initial_state, dtype=np.int64)
+    alive = ~finished[states]
+    max_error = 0.0
+    for _ in range(max_steps):
+      if not alive.any():
+        break
+      actions = np.argmax(Q_flat[:, states], axis=0)
+      explore = env.rng.random(num_envs) < epsilon
+      actions[explore] = env.rng.integers(num_actions, size=np.count_nonzero(explore))
+      new_states, rewards = env.sample(states, actions)
+      targets = rewards + gamma * np.max(Q_flat[:, new_states], axis=0)
+      a, s = actions[alive], states[alive]
+      td_errors = targets[alive] - Q_flat[a, s]
+      np.add.at(Q_flat, (a, s), alpha * td_errors)
+      max_error = max(max_error, np.max(np.abs(td_errors)))
+      states = np.where(alive, new_states, states)
+      alive &= ~finished[states]
+    if monitor.on_iteration("q_learning_batched", batch, max_error):
+      break
+  policy = np.full(model.num_states, -1, dtype=np.int8)
+  states = np.flatnonzero(model.active_mask)
+  policy[states] = np.argmax(Q_flat[:, states], axis=0)
+  policy = policy.reshape(grid_world.height, grid_world.width)
+  return grid_world.policy_to_actions(policy) if as_actions else policy
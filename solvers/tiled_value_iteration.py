@@ -0,0 +1,169 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from solvers.instrumentation import NULL_MONITOR
+from solvers.shared import SharedArrays, attach_arrays
+from solvers.utils import greedy_policy
+
+_worker = {} #Per-process state set up by _init_worker.
+
+
+def _init_worker(spec: dict):
+  arrays, blocks = attach_arrays(spec)
+  _worker["arrays"], _worker["blocks"] = arrays, blocks
+
+
+def _sweep_tile(arrays: dict,
+                tile: int,
+                gamma: float,
+                source: int) -> float:
+  """
+  Jacobi backup of one tile from buffer V<source> into the other buffer.
+  Returns the largest value change in the tile.
+  """
+  start, stop = arrays["offsets"][tile], arrays["offsets"][tile + 1]
+  V, V_next = (arrays["V0"], arrays["V1"]) if source == 0 else (arrays["V1"], arrays["V0"])
+  states = arrays["states"][start:stop]
+  Q = arrays["R"][start:stop] + gamma * np.einsum("sak,sak->sa", arrays["prob"][start:stop], V[arrays["idx"][start:stop]])
+  V_new = np.max(Q, axis=1)
+  V_next[states] = V_new
+  return float(np.max(np.abs(V_new - V[states]), initial=0.0))
+
+
+def _sweep_tiles(arrays: dict,
+                 tiles: list,
+                 gamma: float,
+                 source: int) -> list:
+  return [_sweep_tile(arrays, tile, gamma, source) for tile in tiles]
+
+
+def _sweep_task(tiles: list,
+                gamma: float,
+                source: int) -> list:
+  return _sweep_tiles(_worker["arrays"], tiles, gamma, source)
+
+
+def _tile_layout(model, tile_shape: tuple) -> tuple:
+  """
+  Groups the active states by tile. Returns the tile grid shape, the states in
+  tile order and the offsets of each tile's run in them.
+  """
+  th, tw = tile_shape
+  grid = (-(-model.height // th), -(-model.width // tw))
+  states = np.flatnonzero(model.active_mask)
+  rows, cols = np.divmod(states, model.width)
+  tile_of = (rows // th) * grid[1] + cols // tw
+  order = np.argsort(tile_of, kind="stable")
+  offsets = np.zeros(grid[0] * grid[1] + 1, dtype=np.int64)
+  np.cumsum(np.bincount(tile_of, minlength=grid[0] * grid[1]), out=offsets[1:])
+  return grid, states[order], offsets
+
+
+def _dilate(mask: np.array) -> np.array:
+  """Marks every tile that is, or shares an edge with, a tile set in mask."""
+  out = mask.copy()
+  out[1:] |= mask[:-1]
+  out[:-1] |= mask[1:]
+  out[:, 1:] |= mask[:, :-1]
+  out[:, :-1] |= mask[:, 1:]
+  return out
+
+
+def tiled_value_iteration(grid_world,
+                          gamma: float=0.9,
+                          theta: float=1e-10,
+                          tile_shape: tuple=(128, 128),
+                          num_workers: int=None,
+                          executor: str="thread",
+                          max_iter: int=1000,
+                          return_stats: bool=False,
+                          monitor=None):
+  """
+  Domain-decomposed Jacobi value iteration.
+  The grid is cut into tiles that are swept independently in a thread or process
+  pool. Every round reads one global value buffer and writes the other, so a
+  tile's one-cell halo is simply its neighbours' entries of the previous round
+  and the exchange is the buffer swap. A tile whose values, and whose
+  neighbours' values, moved by less than theta in the last round is skipped. Once
+  every tile is below theta, one full round without skipping confirms it, so the
+  result satisfies the same stopping rule as value_iteration.
+  Args:
+    grid_world: Instance of GridWorld class.
+    gamma: Discount factor.
+    theta: Minimum threshold to stop, as in value_iteration.
+    tile_shape: (rows, cols) of a tile.
+    num_workers: Pool size; defaults to os.cpu_count().
+    executor: "thread" (numpy releases the GIL in the sweeps) or "process" (the
+      values and tile data live in shared memory).
+    max_iter: Maximum number of rounds.
+    return_stats: If True, also return a dict with rounds, tile sweeps and backups.
+    monitor: Optional solvers.instrumentation.Monitor, given the residual of every round.
+  Returns:
+    Tuple (V, P) as returned by value_iteration with backend="numpy", followed by
+    the stats dict if return_stats is set.
+  """
+  if executor not in ("thread", "process"):
+    raise ValueError(f"Unknown executor: {executor}")
+  monitor = NULL_MONITOR if monitor is None else monitor
+  num_workers = num_workers or os.cpu_count()
+  model = grid_world.model
+  grid, states, offsets = _tile_layout(model, tile_shape)
+  num_tiles = grid[0] * grid[1]
+  V0 = np.where(model.terminal_mask, model.rewards, 0.0)
+  arrays = {"V0": V0, "V1": V0.copy(), "states": states, "offsets": offsets,
+            "idx": model.next_idx[states], "prob": model.next_prob[states], "R": model.R[states]}
+  shared = None
+  if executor == "process":
+    shared = SharedArrays(arrays)
+    arrays = shared.arrays
+    pool = ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(shared.spec,))
+  else:
+    pool = ThreadPoolExecutor(max_workers=num_workers)
+
+  nonempty = (offsets[1:] > offsets[:-1]).reshape(grid)
+  residuals = np.full(grid, np.inf)
+  tile_sweeps = backups = 0
+  source, verifying = 0, False
+  try:
+    with monitor.phase("value_iteration"):
+      for iter in range(max_iter):
+        active = nonempty if verifying else nonempty & _dilate(residuals >= theta)
+        tiles = np.flatnonzero(active)
+        chunks = [chunk.tolist() for chunk in np.array_split(tiles, min(num_workers, max(len(tiles), 1)))]
+        if executor == "process":
+          futures = [pool.submit(_sweep_task, chunk, gamma, source) for chunk in chunks]
+        else:
+          futures = [pool.submit(_sweep_tiles, arrays, chunk, gamma, source) for chunk in chunks]
+        results = np.concatenate([future.result() for future in futures] + [[]])
+        V, V_next = (arrays["V0"], arrays["V1"]) if source == 0 else (arrays["V1"], arrays["V0"])
+        for tile in np.flatnonzero(~active & nonempty): #Skipped tiles carry their values over.
+          run = states[offsets[tile]:offsets[tile + 1]]
+          V_next[run] = V[run]
+        residuals = np.zeros(num_tiles)
+        residuals[tiles] = results
+        residuals = residuals.reshape(grid)
+        source = 1 - source
+        tile_sweeps += len(tiles)
+        backups += int(np.sum(offsets[tiles + 1] - offsets[tiles]))
+        max_diff = float(residuals.max(initial=0.0))
+        monitor.snapshot("tiled_value_iteration", iter, V_next.reshape(grid_world.height, grid_world.width), max_diff)
+        if monitor.on_iteration("tiled_value_iteration", iter, max_diff):
+          break
+        if max_diff < theta:
+          if verifying:
+            break
+          verifying = True
+        else:
+          verifying = False
+      V = np.array(arrays["V0"] if source == 0 else arrays["V1"])
+  finally:
+    pool.shutdown()
+    if shared is not None:
+      shared.close()
+  monitor.count("backups", backups)
+  V = V.reshape(grid_world.height, grid_world.width)
+  P = greedy_policy(model, V, gamma)
+  if return_stats:
+    return V, P, {"iterations": iter + 1, "tile_sweeps": tile_sweeps, "tiles": int(nonempty.sum()),
+                  "backups": backups, "residual": max_diff}
+  return V, P
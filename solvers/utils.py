@@ -1,12 +1,43 @@
+import logging
 import numpy as np
+from grid_world.environment import GridWorld
+from solvers.instrumentation import NULL_MONITOR
+
+logger = logging.getLogger(__name__)
 
 
 def policy_evaluation(grid_world: GridWorld, 
                       policy: np.array,
                       gamma: float=0.9,
                       theta: float=1e-10,
-                      max_iter: int=500):
-  Vk = np.zeros((grid_world.height, grid_world.width)) #Old Value Matrix
+                      max_iter: int=500,
+                      method: str="sweep",
+                      V_init: np.array=None,
+                      monitor=None):
+  """
+  Evaluates a deterministic policy on the grid.
+  Parameters:
+    grid_world: an instance of the GridWorld class defining the problem.
+    policy: int array [H, W] of action indices.
+    gamma: discount factor for the returns.
+    theta: convergence threshold (tolerance of the iterative solvers).
+    max_iter: maximum number of sweeps / solver iterations.
+    method: "sweep" for iterative Bellman sweeps, "direct" for a sparse LU solve of
+      (I - gamma * P_pi) V = R_pi (the factorization is reused while the policy and gamma
+      are unchanged), "krylov" for an ILU-preconditioned GMRES solve.
+    V_init: optional starting values (e.g. the previous V in policy iteration),
+      used by "sweep" and "krylov".
+    monitor: optional solvers.instrumentation.Monitor, given the residual of every sweep.
+  Returns:
+    Array [H, W] of state values.
+  """
+  monitor = NULL_MONITOR if monitor is None else monitor
+  if method in ("direct", "krylov"):
+    monitor.count("linear_solves")
+    return _policy_evaluation_linear(grid_world, policy, gamma, theta, max_iter, method, V_init)
+  if method != "sweep":
+    raise ValueError(f"Unknown method: {method}")
+  Vk = np.zeros((grid_world.height, grid_world.width)) if V_init is None else np.array(V_init, dtype=float) #Old Value Matrix
   for state in grid_world.terminal:
     Vk[state] = grid_world.rewards[state]
   Vk1 = Vk.copy() #New Value Matrix
@@ -21,12 +52,69 @@ def policy_evaluation(grid_world: GridWorld,
         Vk1[state] = q_val
     max_diff = np.max(np.abs(Vk - Vk1))
     Vk = Vk1.copy()
-    if max_diff < theta:
-      print(f"Policy Evaluation converged at sub-iteration {iter} with Theta: {max_diff}")
+    if monitor.on_iteration("policy_evaluation", iter, max_diff) or max_diff < theta:
+      logger.info("Policy Evaluation stopped at sub-iteration %d with Theta: %s", iter, max_diff)
       break
   return Vk
 
 
+def policy_system(model,
+                  policy: np.array,
+                  gamma: float=0.9):
+  """
+  Builds the linear system (I - gamma * P_pi) V = R_pi over the active states.
+  Terminal values are fixed, so their contribution is moved to the right-hand side.
+  Returns:
+    Tuple (A, b, states): scipy CSR matrix, right-hand side and the state index of each row.
+  """
+  from scipy import sparse
+  states = np.flatnonzero(model.active_mask)
+  actions = policy.ravel()[states]
+  idx, prob = model.next_idx[states, actions], model.next_prob[states, actions]
+  position = np.full(model.num_states, -1, dtype=np.int64)
+  position[states] = np.arange(states.size)
+  cols = position[idx]
+  inside = cols >= 0
+  b = model.R[states, actions] + gamma * np.sum(np.where(inside, 0.0, prob * model.rewards[idx]), axis=1)
+  rows = np.broadcast_to(np.arange(states.size)[:, None], idx.shape)
+  P_pi = sparse.csr_matrix((prob[inside], (rows[inside], cols[inside])), shape=(states.size, states.size))
+  A = (sparse.identity(states.size, format="csr") - gamma * P_pi).tocsc()
+  return A, b, states
+
+
+def _policy_evaluation_linear(grid_world: GridWorld,
+                              policy: np.array,
+                              gamma: float=0.9,
+                              theta: float=1e-10,
+                              max_iter: int=500,
+                              method: str="direct",
+                              V_init: np.array=None):
+  from scipy.sparse import linalg
+  model = grid_world.model
+  key = (method, gamma, policy.ravel()[model.active_mask].tobytes())
+  cached = model.cache.get("policy_evaluation")
+  if cached is not None and cached[0] == key:
+    solver, b, states = cached[1:]
+  else:
+    A, b, states = policy_system(model, policy, gamma)
+    if method == "direct":
+      solver = linalg.splu(A)
+    else:
+      ilu = linalg.spilu(A, drop_tol=1e-5, fill_factor=5)
+      solver = (A, linalg.LinearOperator(A.shape, ilu.solve))
+    model.cache["policy_evaluation"] = (key, solver, b, states)
+  V = np.where(model.terminal_mask, model.rewards, 0.0)
+  if method == "direct":
+    V[states] = solver.solve(b)
+  else:
+    A, M = solver
+    x0 = None if V_init is None else np.asarray(V_init, dtype=float).ravel()[states]
+    V[states], info = linalg.gmres(A, b, x0=x0, M=M, rtol=0.0, atol=theta, maxiter=max_iter)
+    if info > 0:
+      logger.warning("Policy Evaluation (krylov) stopped at %d iterations without reaching Theta: %s", info, theta)
+  return V.reshape(grid_world.height, grid_world.width)
+
+
 def policy_improvement(grid_world: GridWorld,
                        V: np.array,
                        gamma: float=0.9):
@@ -43,3 +131,110 @@ def policy_improvement(grid_world: GridWorld,
         Q.append(q_val)
       policy[state] = np.argmax(Q)
   return policy
+
+
+def bellman_q(model,
+              V: np.array,
+              gamma: float=0.9,
+              states: np.array=None) -> np.array:
+  """
+  Computes the action values Q = R + gamma * P @ V for a batch of states at once.
+  Parameters:
+    model: TransitionModel of the grid (GridWorld.model).
+    V: Flat array [S] of state values.
+    gamma: discount factor for the returns.
+    states: Optional array of state indices; defaults to every state.
+  Returns:
+    Array [len(states), A] of action values.
+  """
+  if states is None:
+    idx, prob, R = model.next_idx, model.next_prob, model.R
+  else:
+    idx, prob, R = model.next_idx[states], model.next_prob[states], model.R[states]
+  return R + gamma * np.einsum("sak,sak->sa", prob, V[idx])
+
+
+def greedy_policy(model,
+                  V: np.array,
+                  gamma: float=0.9) -> np.array:
+  """
+  Vectorized counterpart of policy_improvement working on the compiled model.
+  Returns an int array [H, W] of action indices, -1 on walls and terminal states.
+  """
+  policy = np.full(model.num_states, -1, dtype=int)
+  states = np.flatnonzero(model.active_mask)
+  policy[states] = np.argmax(bellman_q(model, V.ravel(), gamma, states), axis=1)
+  return policy.reshape(model.height, model.width)
+
+
+def partial_policy_evaluation(model,
+                              policy: np.array,
+                              V: np.array,
+                              gamma: float=0.9,
+                              theta: float=1e-10,
+                              k: int=5,
+                              states: np.array=None):
+  """
+  Runs k synchronous evaluation sweeps of a fixed policy, restricted to the states
+  whose values can still move. After each sweep only the predecessors of states
+  that changed by more than theta are swept again.
+  Parameters:
+    model: TransitionModel of the grid.
+    policy: int array [H, W] (or flat [S]) of action indices.
+    V: Flat array [S] of state values, updated in place.
+    gamma: discount factor for the returns.
+    theta: changes at or below theta are not propagated.
+    k: maximum number of sweeps.
+    states: state indices to sweep first; defaults to every active state.
+  Returns:
+    Tuple (touched, frontier, backups): states whose value changed, states still
+    pending another sweep, and the number of single-state backups performed.
+  """
+  policy = policy.ravel()
+  region = np.flatnonzero(model.active_mask) if states is None else np.asarray(states, dtype=np.int64)
+  touched = []
+  backups = 0
+  for _ in range(k):
+    if region.size == 0:
+      break
+    actions = policy[region]
+    V_new = model.R[region, actions] + gamma * np.sum(model.next_prob[region, actions] * V[model.next_idx[region, actions]], axis=1)
+    moved = region[np.abs(V_new - V[region]) > theta]
+    V[region] = V_new
+    backups += region.size
+    touched.append(moved)
+    region = model.predecessors_of(moved)
+  touched = np.unique(np.concatenate(touched)) if touched else np.array([], dtype=np.int64)
+  return touched, region, backups
+
+
+def policy_improvement_incremental(model,
+                                   V: np.array,
+                                   policy: np.array,
+                                   gamma: float=0.9,
+                                   states: np.array=None,
+                                   tol: float=1e-12):
+  """
+  Greedy improvement of the given states only, updating policy in place.
+  An action is replaced only if it beats the current one by more than tol, so ties
+  do not flip back and forth between iterations.
+  Parameters:
+    model: TransitionModel of the grid.
+    V: Flat array [S] of state values.
+    policy: int array [H, W] (or flat [S]) of action indices, modified in place.
+    gamma: discount factor for the returns.
+    states: state indices to improve; defaults to every active state.
+    tol: minimum improvement needed to switch action.
+  Returns:
+    Array of the state indices whose greedy action changed.
+  """
+  flat_policy = policy.reshape(-1)
+  states = np.flatnonzero(model.active_mask) if states is None else np.asarray(states, dtype=np.int64)
+  Q = bellman_q(model, V, gamma, states)
+  rows = np.arange(states.size)
+  best = np.argmax(Q, axis=1)
+  current = flat_policy[states]
+  current_q = np.where(current >= 0, Q[rows, np.maximum(current, 0)], -np.inf)
+  switch = Q[rows, best] > current_q + tol
+  flat_policy[states[switch]] = best[switch]
+  return states[switch]
@@ -1,25 +1,80 @@
+import heapq
+import logging
+from collections import defaultdict
 import numpy as np
 from grid_world.environment import GridWorld
+from solvers.instrumentation import NULL_MONITOR
+from solvers.utils import bellman_q, greedy_policy, policy_evaluation, policy_improvement
+
+logger = logging.getLogger(__name__)
+
 
 def value_iteration(grid_world, 
                     gamma: float=0.9, 
-                    theta: float=1e-10):
-    """
+                    theta: float=1e-10,
+                    backend: str="python",
+                    mode: str="jacobi",
+                    return_stats: bool=False,
+                    monitor=None,
+                    V_init: np.array=None):
+  """
   Performs Value Iteration for solving the Grid World problem.
   Parameters:
     grid_world: an instance of the GridWorld class defining the problem.
     gamma: discount factor for the returns.
     theta: minimum threshold to stop Value Iteration.
+    backend: "python" for the per-state loop, "numpy" for whole-grid array sweeps.
+    mode: update schedule. "jacobi" sweeps synchronously from a copy of the old values,
+      "gauss_seidel" updates in place, "prioritized" only backs up the states with the
+      largest pending Bellman error (prioritized sweeping).
+    return_stats: if True, also return a dict with the number of sweeps (iterations),
+      backups and the final residual; "prioritized" also reports the fractional
+      equivalent_sweeps (backups per active state) and whether it stopped at the cap of
+      1000 sweeps' worth of backups (capped).
+    monitor: optional solvers.instrumentation.Monitor; receives the residual of every
+      sweep (and may stop the solve), the "value_iteration" phase time and the backup count.
+      "prioritized" reports the largest pending error bound after every sweep's worth
+      of backups (one per active state).
+    V_init: optional starting values [H, W] (e.g. a cached solution of the same layout);
+      terminal states are still set to their rewards.
   Returns:
-    Tuple (V, P) for the state values and the deterministi policy for the grid.
+    Tuple (V, P) for the state values and the deterministi policy for the grid,
+    followed by the stats dict if return_stats is set.
   """
-  Vk = np.zeros((grid_world.height, grid_world.width)) #Old Value Matrix
+  if backend not in ("python", "numpy"):
+    raise ValueError(f"Unknown backend: {backend}")
+  if mode not in ("jacobi", "gauss_seidel", "prioritized"):
+    raise ValueError(f"Unknown mode: {mode}")
+  monitor = NULL_MONITOR if monitor is None else monitor
+  with monitor.phase("value_iteration"):
+    if mode == "prioritized":
+      Vk, stats = _value_iteration_prioritized(grid_world, gamma, theta, monitor, V_init)
+      P = greedy_policy(grid_world.model, Vk, gamma) if backend == "numpy" else policy_improvement(grid_world, Vk, gamma)
+    elif backend == "numpy":
+      Vk, P, stats = _value_iteration_numpy(grid_world, gamma, theta, mode, monitor, V_init)
+    else:
+      Vk, P, stats = _value_iteration_python(grid_world, gamma, theta, mode, monitor, V_init)
+  monitor.count("backups", stats["backups"])
+  if return_stats:
+    return Vk, P, stats
+  return Vk, P
+
+
+def _value_iteration_python(grid_world,
+                            gamma: float=0.9,
+                            theta: float=1e-10,
+                            mode: str="jacobi",
+                            monitor=NULL_MONITOR,
+                            V_init: np.array=None):
+  Vk = np.zeros((grid_world.height, grid_world.width)) if V_init is None else np.array(V_init, dtype=float) #Old Value Matrix
   P = np.zeros((grid_world.height, grid_world.width)) #Current Policy
   for state in grid_world.terminal:
     Vk[state] = grid_world.rewards[state]
-  Vk1 = Vk.copy() #PlaceHolder for Updated Value Matrix
+  Vk1 = Vk if mode == "gauss_seidel" else Vk.copy() #PlaceHolder for Updated Value Matrix, in place for Gauss-Seidel
   states = grid_world.get_valid_states()
+  backups = 0
   for iter in range(1000):
+    max_diff = 0.0
     for state in states:
       if state in grid_world.terminal:
         continue
@@ -30,19 +85,166 @@ def value_iteration(grid_world,
         for prob, new_state, reward in possible_outcomes:
           q_val += prob * (reward + gamma * Vk[new_state])
         Q.append(q_val)
+      max_diff = max(max_diff, abs(np.max(Q) - Vk[state]))
       Vk1[state] = np.max(Q)
-    max_diff = np.max(np.abs(Vk - Vk1))
-    Vk = Vk1.copy()
-    if max_diff < theta:
-      print(f"iteration: {iter}, Theta: {max_diff}")
+      backups += 1
+    if mode == "jacobi":
+      Vk = Vk1.copy()
+    monitor.snapshot("value_iteration", iter, Vk, max_diff)
+    if monitor.on_iteration("value_iteration", iter, max_diff) or max_diff < theta:
+      logger.info("iteration: %d, Theta: %s", iter, max_diff)
       break
   P = policy_improvement(grid_world, Vk, gamma)
-  return Vk, P
+  return Vk, P, {"mode": mode, "iterations": iter + 1, "backups": backups, "residual": max_diff}
+
+
+def _value_iteration_numpy(grid_world,
+                           gamma: float=0.9,
+                           theta: float=1e-10,
+                           mode: str="jacobi",
+                           monitor=NULL_MONITOR,
+                           V_init: np.array=None):
+  model = grid_world.model
+  V = np.where(model.terminal_mask, model.rewards, 0.0 if V_init is None else np.ravel(V_init))
+  states = np.flatnonzero(model.active_mask)
+  if mode == "gauss_seidel":
+    # Red-black ordering: on a 4-neighbour grid a cell only depends on itself and on
+    # cells of the other colour, so each half-sweep is an exact in-place update.
+    rows, cols = np.divmod(states, grid_world.width)
+    groups = [states[(rows + cols) % 2 == 0], states[(rows + cols) % 2 == 1]]
+  else:
+    groups = [states]
+  blocks = [(group, model.next_idx[group], model.next_prob[group], model.R[group]) for group in groups]
+  for iter in range(1000):
+    max_diff = 0.0
+    for group, idx, prob, R in blocks:
+      V_new = np.max(R + gamma * np.einsum("sak,sak->sa", prob, V[idx]), axis=1)
+      max_diff = max(max_diff, np.max(np.abs(V[group] - V_new), initial=0.0))
+      V[group] = V_new
+    monitor.snapshot("value_iteration", iter, V.reshape(grid_world.height, grid_world.width), max_diff)
+    if monitor.on_iteration("value_iteration", iter, max_diff) or max_diff < theta:
+      logger.info("iteration: %d, Theta: %s", iter, max_diff)
+      break
+  V = V.reshape(grid_world.height, grid_world.width)
+  stats = {"mode": mode, "iterations": iter + 1, "backups": (iter + 1) * states.size, "residual": max_diff}
+  return V, greedy_policy(model, V, gamma), stats
+
+
+def _value_iteration_prioritized(grid_world,
+                                 gamma: float=0.9,
+                                 theta: float=1e-10,
+                                 monitor=NULL_MONITOR,
+                                 V_init: np.array=None):
+  model = grid_world.model
+  V = np.where(model.terminal_mask, model.rewards, 0.0 if V_init is None else np.ravel(V_init))
+  states = np.flatnonzero(model.active_mask)
+  max_backups = 1000 * states.size #The same 1000-sweep cap as the other modes.
+  backups = prioritized_sweeping(model, V, gamma, theta, max_backups=max_backups, monitor=monitor,
+                                 solver="value_iteration")
+  if backups >= max_backups:
+    logger.warning("Prioritized sweeping stopped at the cap of %d backups", max_backups)
+  residual = float(np.max(np.abs(np.max(bellman_q(model, V, gamma, states), axis=1) - V[states]), initial=0.0))
+  V = V.reshape(grid_world.height, grid_world.width)
+  sweeps = backups / max(states.size, 1)
+  logger.info("backups: %d (%.2f sweeps), residual: %s", backups, sweeps, residual)
+  # Prioritized sweeping has no sweeps; iterations counts the whole sweeps its backups add up to.
+  return V, {"mode": "prioritized", "iterations": int(np.ceil(sweeps)), "equivalent_sweeps": sweeps,
+             "backups": backups, "residual": residual, "capped": backups >= max_backups}
+
+
+def prioritized_sweeping(model,
+                         V: np.array,
+                         gamma: float=0.9,
+                         theta: float=1e-10,
+                         seeds: np.array=None,
+                         max_backups: int=None,
+                         monitor=NULL_MONITOR,
+                         report_every: int=None,
+                         solver: str="prioritized_sweeping") -> int:
+  """
+  Runs prioritized sweeping on the flat value array V, updating it in place.
+  Each state carries an upper bound on its Bellman error. Backing up a state
+  resets its bound and raises the bounds of its predecessors by gamma * |change|,
+  so only states whose successors actually moved are revisited.
+  Parameters:
+    model: TransitionModel of the grid.
+    V: Flat array [S] of state values, modified in place.
+    gamma: discount factor for the returns.
+    theta: states whose error bound is at most theta are left alone.
+    seeds: optional state indices to start from; defaults to every active state.
+    max_backups: optional cap on the number of backups.
+    monitor: solvers.instrumentation.Monitor; every report_every backups it gets the
+      largest pending error bound as the residual, and a True return stops the sweep.
+    report_every: backups between reports; defaults to the number of active states,
+      so each report stands for one sweep's worth of backups.
+    solver: name the reports are made under.
+  Returns:
+    Number of single-state backups performed.
+  """
+  pred_indptr, pred_indices = model.predecessors()
+  idx, prob, R = model.next_idx, model.next_prob, model.R
+  if seeds is None:
+    seeds = np.flatnonzero(model.active_mask)
+    values, priority = V.tolist(), [0.0] * model.num_states
+  else:
+    # A seeded run usually stays local, so only the states it reaches are copied.
+    values, priority = _LazyValues(V), defaultdict(float)
+  seeds = seeds[model.active_mask[seeds]]
+  report_every = max(int(np.count_nonzero(model.active_mask)), 1) if report_every is None else report_every
+  errors = np.abs(np.max(bellman_q(model, V, gamma, seeds), axis=1) - V[seeds])
+  heap = [(-error, s) for s, error in zip(seeds.tolist(), errors.tolist()) if error > theta]
+  for neg_error, s in heap:
+    priority[s] = -neg_error
+  heapq.heapify(heap)
+  # The pops are inherently sequential, so the inner loop works on plain Python
+  # lists (or dicts) and writes back into V once at the end.
+  backups = 0
+  while heap and (max_backups is None or backups < max_backups):
+    neg_priority, s = heapq.heappop(heap)
+    if -neg_priority != priority[s]: #Stale entry, superseded by a later push.
+      continue
+    priority[s] = 0.0
+    v = max(r + gamma * sum(p * values[i] for p, i in zip(probs, nexts))
+            for r, probs, nexts in zip(R[s].tolist(), prob[s].tolist(), idx[s].tolist()))
+    delta = abs(v - values[s])
+    values[s] = v
+    backups += 1
+    for p in pred_indices[pred_indptr[s]:pred_indptr[s + 1]].tolist():
+      priority[p] += gamma * delta
+      if priority[p] > theta:
+        heapq.heappush(heap, (-priority[p], p))
+    #The top entry may be stale, so the reported residual is an upper bound.
+    if backups % report_every == 0 and monitor.on_iteration(solver, backups // report_every - 1,
+                                                            -heap[0][0] if heap else 0.0):
+      break
+  if isinstance(values, list):
+    V[:] = values
+  elif values:
+    V[list(values)] = list(values.values())
+  return backups
+
+
+class _LazyValues(dict):
+  """Dict of state values that reads each missing state from the array V once."""
+  def __init__(self, V: np.array):
+    super().__init__()
+    self._V = V
+
+  def __missing__(self, s: int) -> float:
+    value = self[s] = self._V.item(s)
+    return value
 
 
 def value_iteration_deterministic(grid_world, 
                     gamma: float=0.9, 
-                    theta: float=1e-8):
+                    theta: float=1e-8,
+                    backend: str="python",
+                    monitor=None):
+  monitor = NULL_MONITOR if monitor is None else monitor
+  if backend == "numpy":
+    return _value_iteration_deterministic_numpy(grid_world, gamma, theta, monitor)
+  if backend != "python":
+    raise ValueError(f"Unknown backend: {backend}")
   Vk = np.zeros((grid_world.height, grid_world.width))
   Q = np.zeros((grid_world.height, grid_world.width, len(grid_world.actions)))
   P = np.zeros((grid_world.height, grid_world.width))
@@ -59,39 +261,33 @@ def value_iteration_deterministic(grid_world,
         Vk1[i, j] = np.max(Q[i, j, :])
     max_diff = np.max(np.abs(Vk - Vk1))
     Vk = Vk1.copy()
-    if max_diff < theta:
-      print(f"iteration: {iter}, Theta: {max_diff}")
+    monitor.snapshot("value_iteration_deterministic", iter, Vk, max_diff)
+    if monitor.on_iteration("value_iteration_deterministic", iter, max_diff) or max_diff < theta:
+      logger.info("iteration: %d, Theta: %s", iter, max_diff)
       break
   for state in grid_world.terminal:
     Vk[state] = grid_world.rewards[state]
   return Vk, P
 
 
-def policy_evaluation(grid_world: GridWorld, 
-                      policy: np.array,
-                      gamma: float=0.9,
-                      theta: float=1e-10,
-                      max_iter: int=500):
-  Vk = np.zeros((grid_world.height, grid_world.width)) #Old Value Matrix
-  for i in range(grid_world.height):
-    for j in range(grid_world.width):
-        if (i, j) in grid_world.terminal:
-          Vk[i, j] = grid_world.rewards[i, j]
-
-  Vk1 = Vk.copy() #New Value Matrix
-  for iter in range(max_iter):
-    for i in range(grid_world.height):
-      for j in range(grid_world.width):
-        if (i, j) not in grid_world.terminal:
-          possible_outcomes = grid_world.get_transition_probs((i, j), grid_world.actions[policy[i, j]])
-          q_val = 0.0
-          for prob, new_state, reward in possible_outcomes:
-            q_val += prob * (reward + gamma * Vk[new_state])
-          Vk1[i, j] = q_val
+def _value_iteration_deterministic_numpy(grid_world,
+                                         gamma: float=0.9,
+                                         theta: float=1e-8,
+                                         monitor=NULL_MONITOR):
+  model = grid_world.model
+  moving = ~model.terminal_mask
+  next_state = model.next_state[moving]
+  Vk = np.zeros(model.num_states)
+  Q = np.zeros((model.num_states, model.num_actions))
+  for iter in range(1000):
+    Q[moving] = grid_world.step_cost + gamma * Vk[next_state]
+    Vk1 = np.max(Q, axis=1)
     max_diff = np.max(np.abs(Vk - Vk1))
-    Vk = Vk1.copy()
-    if max_diff < theta:
-      print(f"Policy Evaluation converged at sub-iteration {iter} with Theta: {max_diff}")
+    Vk = Vk1
+    monitor.snapshot("value_iteration_deterministic", iter, Vk.reshape(grid_world.height, grid_world.width), max_diff)
+    if monitor.on_iteration("value_iteration_deterministic", iter, max_diff) or max_diff < theta:
+      logger.info("iteration: %d, Theta: %s", iter, max_diff)
       break
-  return Vk
-
+  P = np.argmax(Q, axis=1).astype(float).reshape(grid_world.height, grid_world.width)
+  Vk = np.where(model.terminal_mask, model.rewards, Vk).reshape(grid_world.height, grid_world.width)
+  return Vk, P